@@ -0,0 +1,81 @@
+# Compares the old link detection (stringify the message to look for "navi", then index('<') into the
+# text for the first link) against the compiled single-pass extractor on a synthetic corpus, offline.
+# Run from the repo root: python bench/bench_extract.py [messages]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from extract import message_links, is_bot_message  # noqa: E402
+
+corpus_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+distinct = 5000
+
+
+def old_is_link(text):
+    if len(text) > 0 and '<' in text and text[text.index('<') + 1] == 'h' and 'gist.github.com/ElBell' not in text:
+        return True
+    return False
+
+
+def old_links(message):
+    if 'navi' in str(message).lower():
+        return []
+    if 'attachments' in message:
+        return [attachment['original_url'] for attachment in message['attachments'] if 'original_url' in attachment]
+    text = message['text']
+    if old_is_link(text):
+        return [text[text.index('<') + 1:text.index('>')]]
+    return []
+
+
+def new_links(message):
+    if is_bot_message(message):
+        return []
+    return [url for url, _ in message_links(message)] + \
+        [attachment['original_url'] for attachment in message.get('attachments', []) if 'original_url' in attachment]
+
+
+def message(rng: random.Random, n):
+    base = {'type': 'message', 'user': f"U{rng.randrange(50)}", 'ts': f"{1500000000 + n}.000{n % 100:02d}"}
+    kind = rng.random()
+    words = " ".join(rng.choice(["the", "java", "lab", "stream", "help", "anyone", "lunch", "<@U12>"])
+                     for _ in range(rng.randrange(3, 30)))
+    # like real user messages, every human message carries rich text blocks mirroring its text
+    if kind < 0.70:
+        return dict(base, text=words, blocks=[
+            {'type': 'rich_text', 'elements': [{'type': 'rich_text_section', 'elements': [
+                {'type': 'text', 'text': words}]}]}])
+    if kind < 0.85:
+        url = f"https://example{n % 97}.com/post/{n}"
+        return dict(base, text=f"{words} <{url}|{url[8:]}> and <https://docs.oracle.com/{n}>", blocks=[
+            {'type': 'rich_text', 'elements': [{'type': 'rich_text_section', 'elements': [
+                {'type': 'text', 'text': words}, {'type': 'link', 'url': url, 'text': url[8:]}]}]}])
+    if kind < 0.95:
+        url = f"https://github.com/zipcoder/repo{n}"
+        return dict(base, text=f"<{url}>", attachments=[{'original_url': url, 'title': words, 'text': words * 3}])
+    return dict(base, bot_id="B1", subtype="bot_message", text=f"Here you go <https://gist.github.com/ElBell/{n}>")
+
+
+def run(name, extract, corpus, rounds):
+    started = time.perf_counter()
+    found = 0
+    for _ in range(rounds):
+        for item in corpus:
+            found += len(extract(item))
+    elapsed = time.perf_counter() - started
+    total = rounds * len(corpus)
+    print(f"{name:>10}: {elapsed:7.2f} s for {total} messages, {elapsed / total * 1e6:6.2f} us/message, {found} links")
+
+
+def main():
+    rng = random.Random(19)
+    corpus = [message(rng, n) for n in range(distinct)]
+    rounds = max(1, corpus_size // distinct)
+    run("old", old_links, corpus, rounds)
+    run("extractor", new_links, corpus, rounds)
+
+
+if __name__ == '__main__':
+    main()
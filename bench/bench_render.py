@@ -0,0 +1,62 @@
+# Times rendering a large channel's md: the first full render, a full re-render with every line
+# already cached (as at compaction), and taking one new link (bisect insertion, one formatted line,
+# one join). Offline, titles and names are stubbed. Run from the repo root: python bench/bench_render.py [links]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+for name in ("NAVI_METADATA_CACHE", "NAVI_URL_INDEX", "NAVI_LINK_INDEX"):
+    os.environ.setdefault(name, ":memory:")
+os.environ.setdefault("OAUTH_ACCESS_TOKEN", "bench")
+os.environ.setdefault("GIST_ACCESS_TOKEN", "bench")
+import history  # noqa: E402
+from history import ChannelState, Link, assemble_md, original_json, render_sections  # noqa: E402
+from shards import Manifest  # noqa: E402
+
+link_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+hosts = ["github.com", "stackoverflow.com", "docs.oracle.com", "medium.com", "docs.python.org", "dev.to"]
+users = {f"U{n}": f"Person {n}" for n in range(40)}
+
+
+def timed(name, work, rounds=1):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = work()
+    print(f"{name:>32}: {(time.perf_counter() - started) / rounds * 1000:9.3f} ms")
+    return result
+
+
+def main():
+    history.get_users = lambda: users
+    history.get_channel_name = lambda channel_id: "bench"
+    history.title_resolver.fetch = lambda url: ("Title of " + url, "ok")
+    links = [Link(f"https://{hosts[n % len(hosts)]}/post/{n}", f"U{n % 40}", f"{1500000000 + n * 60}.000100")
+             for n in range(link_count)]
+    sectioned = history.sort_into_sections(links)
+    history.url_index.record("C1", links)
+    history.title_resolver.resolve_all(history.canonical_url(link.url) for link in links)
+    print(f"{link_count} links")
+    history.line_cache.lines.clear()
+    timed("full render, nothing cached", lambda: assemble_md("bench", render_sections(sectioned, users, "C1")))
+    timed("full render, lines cached", lambda: assemble_md("bench", render_sections(sectioned, users, "C1")), 5)
+    # the whole history as one shard, the worst case
+    manifest = Manifest("bench", str(link_count * 2), [{'key': "0001", 'links': link_count}])
+    state = timed("load channel state", lambda: ChannelState("C1", ["j", "m"], "bench.json", "bench.md", manifest,
+                                                            original_sections(sectioned)))
+    timed("state re-render (compaction)", lambda: (state.render(), state.md()), 5)
+    new = iter(range(10 ** 6))
+
+    def one_more():
+        n = next(new)
+        state.insert([Link(f"https://example.com/new/{n}", "U1", f"{1600000000 + n}.000100")])
+        return state.md()
+    timed("one new link + md", one_more, 20)
+
+
+def original_sections(sectioned):
+    return {section: [Link.from_json(data) for data in links] for section, links in original_json(sectioned).items()}
+
+
+if __name__ == '__main__':
+    main()
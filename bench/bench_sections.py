@@ -0,0 +1,59 @@
+# Compares the old section lookup (substring scan over the sections dict, once for the first match as
+# get_section did and once for every match as add_to_section did) against the section rules.
+# Offline. Run from the repo root: python bench/bench_sections.py [urls]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from sections import classifiers  # noqa: E402
+
+url_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+distinct = 10000
+old_sections = {"git": "GitHub", "stackoverflow": "StackOverflow", "java": "Java", "python": "Python",
+                "interview": "Interview", "": "Misc"}
+hosts = ["github.com", "gist.github.com", "stackoverflow.com", "docs.oracle.com", "docs.python.org",
+         "medium.com", "www.youtube.com", "leetcode.com", "en.wikipedia.org", "dev.to", "www.baeldung.com"]
+words = ["java", "python", "interview", "streams", "questions", "spring", "tutorial", "lambda", "guide", "x"]
+
+
+def old_first(url):
+    for key, title in old_sections.items():
+        if key in url:
+            return title
+
+
+def old_all(url):
+    return [title for key, title in old_sections.items() if key in url]
+
+
+def url(rng: random.Random, n):
+    path = "/".join(rng.choice(words) for _ in range(rng.randrange(1, 5)))
+    return f"https://{rng.choice(hosts)}/{path}/{n}?ref={rng.choice(words)}"
+
+
+def run(name, classify, urls, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for item in urls:
+            classify(item)
+    elapsed = time.perf_counter() - started
+    total = rounds * len(urls)
+    print(f"{name:>12}: {elapsed:6.2f} s for {total} urls, {elapsed / total * 1e6:5.2f} us/url")
+
+
+def main():
+    rng = random.Random(20)
+    urls = [url(rng, n) for n in range(distinct)]
+    rounds = max(1, url_count // distinct)
+    classifier = classifiers.get()
+    run("old first", old_first, urls, rounds)
+    run("old all", old_all, urls, rounds)
+    run("rules", classifier.classify, urls, rounds)
+    moved = sum(1 for item in urls if old_first(item) != classifier.classify(item))
+    print(f"{moved} of {len(urls)} urls land in a different section under the default rules")
+
+
+if __name__ == '__main__':
+    main()
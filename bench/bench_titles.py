@@ -0,0 +1,55 @@
+# Compares the old full-body Beautiful Soup title lookup against the streaming head-only extractor
+# on synthetic pages, offline. Run from the repo root: python bench/bench_titles.py
+import os
+import sys
+import time
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("NAVI_METADATA_CACHE", ":memory:")
+from titles import extract_title, chunk_size  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        self.bytes_read = 0
+
+    def iter_content(self, chunk_size=chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            self.bytes_read += min(chunk_size, len(self.body) - start)
+            yield self.body[start:start + chunk_size]
+
+    @property
+    def text(self):
+        self.bytes_read = len(self.body)
+        return self.body.decode('utf-8')
+
+
+def page(size):
+    head = b"<html><head><meta charset='utf-8'><title>Synthetic page</title><link rel='stylesheet' href='x.css'></head>"
+    paragraph = b"<p>" + b"lorem ipsum dolor sit amet " * 20 + b"</p>\n"
+    return head + b"<body>" + paragraph * (size // len(paragraph)) + b"</body></html>"
+
+
+def run(name, extract, body, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        response = FakeResponse(body)
+        title = extract(response)
+    elapsed = (time.perf_counter() - started) / rounds
+    print(f"{name:>10}: {elapsed * 1000:9.3f} ms/page {response.bytes_read:>10} bytes read  title={title!r}")
+
+
+def main():
+    for size in (16 * 1024, 512 * 1024, 4 * 1024 * 1024):
+        body = page(size)
+        rounds = max(3, (8 * 1024 * 1024) // len(body))
+        print(f"page of {len(body)} bytes, {rounds} rounds")
+        run("full soup", lambda response: BeautifulSoup(response.text, 'lxml').title.string, body, rounds)
+        run("streaming", extract_title, body, rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,115 @@
+import asyncio
+import json
 import os
-import time
+import random
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from websocket import WebSocketConnectionClosedException
 
 import event
+from history import user_directory, channel_directory, write_buffer, storage
+from ratelimit import governor, GovernedSlackClient
 from slackclient import SlackClient
+from slackclient.server import SlackConnectionError
+
+keepalive_interval = 30
+reconnect_base = 1
+reconnect_cap = 60
 
 
 class Bot(object):
     def __init__(self):
-        self.slack_client = SlackClient(os.environ["BOT_SLACK_API_TOKEN"])
+        self.slack_client = GovernedSlackClient(SlackClient(os.environ["BOT_SLACK_API_TOKEN"]), governor)
         self.bot_name = "navi"
         self.bot_id = self.get_bot_id()
 
         if self.bot_id is None:
             exit("Error, could not find " + self.bot_name)
 
+        channel_directory.load()
         self.event = event.Event(self)
-        self.listen()
+        signal.signal(signal.SIGTERM, self.terminate)
+        # handlers run one at a time, in arrival order, off the event loop thread
+        self.handlers = ThreadPoolExecutor(max_workers=1, thread_name_prefix="handlers")
+        asyncio.run(self.listen())
+
+    # Heroku sends SIGTERM and kills the dyno 30s later. Queued link writes are flushed first, since
+    # exiting waits for the job workers, and queued jobs are dropped so only a running one holds it up
+    def terminate(self, signum, frame):
+        write_buffer.flush()
+        storage.flush()
+        self.event.jobs.shutdown()
+        sys.exit(0)
 
     def get_bot_id(self):
-        api_call = self.slack_client.api_call("users.list")
-        if api_call.get('ok'):
-            # retrieve all users so we can find our bot
-            users = api_call.get('members')
-            for user in users:
-                if 'name' in user and user.get('name') == self.bot_name:
-                    return "<@" + user.get('id') + ">"
-            return None
-
-    def listen(self):
-        if self.slack_client.rtm_connect():
-            print("Successfully connected, listening for events")
-            while True:
+        # load the shared user directory up front, it is also how we find our bot
+        user_directory.load()
+        user_id = user_directory.id_for(self.bot_name)
+        if user_id is not None:
+            return "<@" + user_id + ">"
+        return None
+
+    async def listen(self):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            connected = await loop.run_in_executor(None, self.slack_client.rtm_connect)
+            if connected:
+                print("Successfully connected, listening for events")
+                attempt = 0
                 try:
-                    self.event.wait_for_event()
-                    time.sleep(1)
-                except WebSocketConnectionClosedException:
-                    self.slack_client.rtm_connect()
-        else:
-            print(self.slack_client.api_call('rtm.connect'))
+                    await self.consume(loop)
+                except (WebSocketConnectionClosedException, SlackConnectionError, OSError) as e:
+                    print(f"Lost the RTM connection: {e!r}")
+            else:
+                print(self.slack_client.api_call('rtm.connect'))
+            await asyncio.sleep(reconnect_delay(attempt))
+            attempt += 1
+
+    # Wake up only when the websocket has data, drain every frame waiting on it and hand each
+    # event to the handler thread without waiting for it to finish
+    async def consume(self, loop):
+        readable = asyncio.Event()
+        fileno = self.slack_client.server.websocket.sock.fileno()
+        loop.add_reader(fileno, readable.set)
+        keepalive = loop.create_task(self.keepalive())
+        try:
+            while True:
+                waiter = loop.create_task(readable.wait())
+                done, _ = await asyncio.wait([waiter, keepalive], return_when=asyncio.FIRST_COMPLETED)
+                if keepalive in done:
+                    waiter.cancel()
+                    keepalive.result()
+                readable.clear()
+                for item in self.read_events():
+                    loop.run_in_executor(self.handlers, self.handle, item)
+        finally:
+            loop.remove_reader(fileno)
+            keepalive.cancel()
+
+    def handle(self, item):
+        try:
+            self.event.parse_event(item)
+        except Exception as e:
+            print(f"Failed to handle {item.get('type')} event: {e!r}")
+
+    def read_events(self):
+        events = self.slack_client.rtm_read()
+        while events:
+            yield from events
+            events = self.slack_client.rtm_read()
+
+    # Pings keep the connection from idling out and surface a dead socket as an exception. They go
+    # straight to the websocket: Server.ping swallows send errors and reconnects on its own, swapping
+    # the socket out from under the reader registered in consume
+    async def keepalive(self):
+        while True:
+            await asyncio.sleep(keepalive_interval)
+            self.slack_client.server.websocket.send(json.dumps({"type": "ping"}))
+
+
+# Full jitter exponential backoff between reconnects
+def reconnect_delay(attempt):
+    return random.uniform(0, min(reconnect_cap, reconnect_base * 2 ** attempt))
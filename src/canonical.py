@@ -0,0 +1,78 @@
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+index_path: str = os.environ.get("NAVI_URL_INDEX", "url_index.sqlite3")
+tracking_params = re.compile(r"^(utm_\w+|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|igshid|yclid|_hsenc|_hsmi|"
+                             r"ref|ref_src|ref_url|source|si|spm)$", re.I)
+default_ports = {"http": "80", "https": "443"}
+
+
+# One spelling per page: lower-case scheme and host, no default port, no fragment, no tracking
+# parameters, remaining query parameters sorted, no trailing slash. Slack's "|label" suffix is dropped
+@lru_cache(maxsize=65536)
+def canonical_url(url: str) -> str:
+    url = url.split('|', 1)[0].strip()
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = host if port is None or str(port) == default_ports.get(scheme) else f"{host}:{port}"
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not tracking_params.match(key)))
+    path = parts.path.rstrip('/')
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+# Every post of every canonical url across all channels, on disk. Recording is idempotent per
+# (url, channel, ts), so re-syncing a channel never double counts
+class UrlIndex:
+    def __init__(self, path=index_path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS posts (canonical TEXT NOT NULL, channel TEXT NOT NULL, "
+                                "ts TEXT NOT NULL, url TEXT NOT NULL, PRIMARY KEY (canonical, channel, ts))")
+        self.connection.commit()
+
+    def record(self, channel_id, links: Iterable):
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO posts VALUES (?, ?, ?, ?)",
+                                        [(canonical_url(link.url), channel_id, link.timestamp, link.url)
+                                         for link in links])
+            self.connection.commit()
+
+    # canonical url -> channel it was first posted in
+    def first_channels(self, canonicals: Iterable[str]) -> Dict[str, str]:
+        canonicals = list(dict.fromkeys(canonicals))
+        firsts = {}
+        with self.lock:
+            for start in range(0, len(canonicals), 500):
+                chunk = canonicals[start:start + 500]
+                # sqlite returns the other columns from the row holding the MIN()
+                rows = self.connection.execute(
+                    f"SELECT canonical, channel, MIN(CAST(ts AS REAL)) FROM posts "
+                    f"WHERE canonical IN ({','.join('?' * len(chunk))}) GROUP BY canonical", chunk)
+                firsts.update({canonical: channel for canonical, channel, _ in rows})
+        return firsts
+
+    # The (canonical url, ts) posts among these links already recorded for the channel
+    def known(self, channel_id, links: Iterable) -> Set[Tuple[str, str]]:
+        posts = list(dict.fromkeys((canonical_url(link.url), link.timestamp) for link in links))
+        with self.lock:
+            return {post for post in posts if self.connection.execute(
+                "SELECT 1 FROM posts WHERE canonical = ? AND channel = ? AND ts = ?",
+                (post[0], channel_id, post[1])).fetchone()}
+
+    # ts of the earliest post of the url in the channel, if any
+    def first_post(self, channel_id, canonical) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT ts FROM posts WHERE canonical = ? AND channel = ? "
+                                          "ORDER BY CAST(ts AS REAL) LIMIT 1", (canonical, channel_id)).fetchone()
+        return row[0] if row else None
@@ -1,22 +1,37 @@
-from history import get_history, get_link_to_links, get_channel_name, get_link_to_all
+import threading
+from ratelimit import governor
+from datetime import datetime
+from history import get_history, get_link_to_links, get_channel_name, get_link_to_all, write_buffer, read_keys, \
+    reload_sections, link_index, get_users
 
 
 class Command(object):
-    def __init__(self):
+    def __init__(self, jobs):
         self.channel = None
+        self.jobs = jobs
         self.commands = {
             "has joined the group": self.history,
             "has joined the channel": self.history,
             "find all": self.find_all,
+            "reindex all": self.reindex_all,
+            "reload sections": self.reload_sections,
             "links": self.links,
+            "status": self.status,
             "hey": self.hey
         }
+        # Commands followed by what to act on, e.g. "search java streams"
+        self.argument_commands = {
+            "search": self.search
+        }
 
     def handle_command(self, command, channel):
         self.channel = channel
         response = ""
+        name, _, argument = command.partition(" ")
         if command in self.commands:
             response += self.commands[command]()
+        elif name in self.argument_commands and argument.strip():
+            response += self.argument_commands[name](argument.strip())
         else:
             response += "Sorry I don't understand the command: " + command + ". " + self.help()
 
@@ -25,9 +40,67 @@ class Command(object):
     def hey(self):
         return "listen!"
 
+    # Collecting a whole channel takes a while, so it runs as a job and reports back when it's done
     def history(self):
-        gist = get_history(self.channel)
-        return "I retrieved all the links from " + get_channel_name(self.channel) + ":\n" + gist
+        channel = self.channel
+        job = self.jobs.submit("history", channel,
+                               lambda job: self.retrieved(channel, get_history(channel, job_progress(job))))
+        return "Working on it! I'll post the links from " + get_channel_name(channel) + \
+               " here when I'm done (job #" + str(job.id) + ")"
+
+    def retrieved(self, channel, gist):
+        return "I retrieved all the links from " + get_channel_name(channel) + ":\n" + gist
+
+    # Re-syncs every channel we keep gists for, several at once; the shared rate limits keep the
+    # combined Slack and GitHub traffic under their limits. One summary is posted here at the end
+    def reindex_all(self):
+        channel = self.channel
+        channels = sorted(read_keys().keys())
+        summary = ReindexSummary(len(channels), lambda text: self.jobs.notify(channel, text))
+        for channel_id in channels:
+            job = self.jobs.submit("history", channel_id,
+                                   lambda job, channel_id=channel_id: get_history(channel_id, job_progress(job)),
+                                   report=summary.finished)
+            if job.report != summary.finished:
+                # a history job for this channel was already waiting, it stands in for ours
+                summary.finished(job, None)
+        return "Reindexing " + str(len(channels)) + " channels, ask me for status to see how it's going"
+
+    # Picks up edited section rules for this channel without a restart
+    def reload_sections(self):
+        channel = self.channel
+        self.jobs.submit("reload sections", channel, lambda job: self.sections_reloaded(channel))
+        return "Reloading the section rules for " + get_channel_name(channel)
+
+    def sections_reloaded(self, channel):
+        reload_sections(channel)
+        return "Sorted the links of " + get_channel_name(channel) + " under the new section rules"
+
+    def status(self):
+        jobs = self.jobs.active() + self.jobs.recent()[::-1]
+        response = "Jobs:\n" if jobs else "No jobs running or recently finished.\n"
+        for job in jobs:
+            response += job.describe(get_channel_name(job.channel_id)) + "\n"
+        metrics = write_buffer.metrics
+        response += "Links waiting to be saved: " + str(metrics.queue_depth) + \
+                    ", last save took " + str(round(metrics.last_latency, 2)) + "s\n"
+        response += "Rate limited by Slack " + str(governor.throttles['slack']) + " times, by GitHub " + \
+                    str(governor.throttles['github']) + " times"
+        return response
+
+    # Answered from the local search index, GitHub isn't touched
+    def search(self, terms):
+        results = link_index.search(terms)
+        if not results:
+            return "I couldn't find any links matching " + terms
+        users = get_users()
+        response = "Links matching " + terms + ":\n"
+        for rank, (channel_id, url, title, creator, ts, section, posts) in enumerate(results, 1):
+            posted = datetime.fromtimestamp(float(ts)).strftime('%b %d %Y')
+            response += str(rank) + ". <" + url + "|" + (title or url) + "> in #" + get_channel_name(channel_id) + \
+                " (" + section + "), posted by " + users[creator] + " on " + posted + \
+                (", " + str(posts) + " times" if posts > 1 else "") + "\n"
+        return response
 
     def links(self):
         return get_link_to_links(self.channel)
@@ -40,5 +113,31 @@ class Command(object):
         for command in self.commands:
             if "has joined the" not in command:
                 response += command + "\r\n"
+        for command in self.argument_commands:
+            response += command + " [terms]\r\n"
         response += "Please see my GitHub for further details:\n https://github.com/ElBell/Navi-Slackbot/tree/master"
         return response
+
+
+def job_progress(job):
+    def progress(text):
+        job.progress = text
+    return progress
+
+
+class ReindexSummary:
+    def __init__(self, total, post):
+        self.total = total
+        self.post = post
+        self.done = 0
+        self.failed = []
+        self.lock = threading.Lock()
+
+    def finished(self, job, message):
+        with self.lock:
+            self.done += 1
+            if job.state == "failed":
+                self.failed.append(get_channel_name(job.channel_id))
+            if self.done == self.total:
+                text = "Reindexed " + str(self.total - len(self.failed)) + " of " + str(self.total) + " channels"
+                self.post(text + (", these failed: " + ", ".join(self.failed) if self.failed else ""))
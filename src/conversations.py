@@ -0,0 +1,38 @@
+import os
+import time
+from typing import Dict, Iterator, List
+
+min_page_size = 50
+max_page_size = 1000
+start_page_size: int = int(os.environ.get("NAVI_HISTORY_PAGE_SIZE", 200))
+
+
+# Reads channel history through conversations.history, which covers public, private and shared
+# channels alike. Pages are yielded as they arrive. The page size grows while Slack keeps up and
+# is halved whenever we get rate limited, so a long backfill settles just under the limit
+class HistoryClient:
+    def __init__(self, slack_client, page_size=start_page_size):
+        self.slack_client = slack_client
+        self.page_size = page_size
+
+    def pages(self, channel_id, oldest=None, latest=None) -> Iterator[List[Dict]]:
+        cursor = None
+        while True:
+            bounds = {key: value for key, value in (('cursor', cursor), ('oldest', oldest), ('latest', latest)) if value}
+            response = self.slack_client.api_call("conversations.history", channel=channel_id,
+                                                  limit=self.page_size, **bounds)
+            # a governed client has already waited out and retried any rate limiting, but says it happened
+            if getattr(self.slack_client, 'throttled', False) or response.get('error') == 'ratelimited':
+                self.page_size = max(min_page_size, self.page_size // 2)
+            else:
+                self.page_size = min(max_page_size, self.page_size + min_page_size)
+            if not response.get('ok'):
+                if response.get('error') == 'ratelimited':
+                    time.sleep(int(response.get('headers', {}).get('Retry-After', 1)))
+                    continue
+                raise Exception(f"conversations.history failed for {channel_id}: {response.get('error')}")
+            if response['messages']:
+                yield response['messages']
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not response.get('has_more') or not cursor:
+                return
@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Dict, Optional
+
+page_size = 200
+
+
+# Pages through a cursor-paginated Slack list method, waiting out rate limits, and yields each page
+def paginate(slack_client, method, **kwargs):
+    cursor = None
+    while True:
+        page = slack_client.api_call(method, limit=page_size, **kwargs, **({'cursor': cursor} if cursor else {}))
+        if not page.get('ok'):
+            if page.get('error') == 'ratelimited':
+                time.sleep(int(page.get('headers', {}).get('Retry-After', 1)))
+                continue
+            raise Exception(f"{method} failed: {page.get('error')}")
+        yield page
+        cursor = page.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            return
+
+
+# Shared id -> display name map for the workspace. Bulk loaded once, kept current from RTM
+# user_change/team_join events, and unknown ids are looked up one at a time with users.info. Ids
+# Slack says don't exist keep the id itself as their name, other failures are asked again next time
+class UserDirectory:
+    def __init__(self, slack_client):
+        self.slack_client = slack_client
+        self.names: Dict[str, str] = {}
+        self.handles: Dict[str, str] = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            names, handles = {}, {}
+            for page in paginate(self.slack_client, "users.list"):
+                for user in page['members']:
+                    self.remember(user, names, handles)
+            self.names, self.handles = names, handles
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def remember(self, user, names=None, handles=None):
+        names = self.names if names is None else names
+        handles = self.handles if handles is None else handles
+        if 'profile' in user:
+            names[user['id']] = user['profile']['real_name']
+        if 'name' in user:
+            handles[user['name']] = user['id']
+
+    def handle_event(self, event):
+        if event.get('type') in ('user_change', 'team_join') and 'user' in event:
+            self.remember(event['user'])
+
+    def lookup(self, user_id) -> Optional[str]:
+        self.ensure_loaded()
+        if user_id not in self.names:
+            response = self.slack_client.api_call("users.info", user=user_id)
+            if response.get('ok'):
+                self.remember(response['user'])
+            elif response.get('error') == 'user_not_found':
+                # not asked again for every line that names them, a user_change event or a reload corrects it
+                self.names[user_id] = user_id
+        return self.names.get(user_id)
+
+    # Used as users[link.creator] when rendering, falling back to the raw id for users Slack can't find
+    def __getitem__(self, user_id) -> str:
+        return self.lookup(user_id) or user_id
+
+    def id_for(self, name) -> Optional[str]:
+        self.ensure_loaded()
+        return self.handles.get(name)
+
+
+# Shared channel id -> name map, warmed with one paginated conversations.list call and kept current
+# from RTM rename events. Channels it hasn't seen are looked up on their own
+class ChannelDirectory:
+    def __init__(self, slack_client):
+        self.slack_client = slack_client
+        self.names: Dict[str, str] = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            names = {}
+            for page in paginate(self.slack_client, "conversations.list", types="public_channel,private_channel",
+                                 exclude_archived=False):
+                for channel in page['channels']:
+                    names[channel['id']] = channel['name']
+            self.names = names
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def handle_event(self, event):
+        if event.get('type') in ('channel_rename', 'group_rename', 'channel_created', 'group_joined'):
+            channel = event.get('channel', {})
+            if 'id' in channel and 'name' in channel:
+                self.names[channel['id']] = channel['name']
+
+    def lookup(self, channel_id) -> str:
+        self.ensure_loaded()
+        if channel_id not in self.names:
+            # one method for public and private channels alike
+            response = self.slack_client.api_call("conversations.info", channel=channel_id)
+            if not response.get('ok'):
+                raise Exception(f"conversations.info failed: {response.get('error')}")
+            self.names[channel_id] = response['channel']['name']
+        return self.names[channel_id]
+
+    def __getitem__(self, channel_id) -> str:
+        return self.lookup(channel_id)
@@ -1,29 +1,32 @@
 from command import Command
-from history import link_or_attachment, add_link
+from history import link_or_attachment, add_link, user_directory, channel_directory, all_links_page
+from jobs import JobScheduler
 
 
 class Event:
     def __init__(self, bot):
         self.bot = bot
-        self.command = Command()
-
-    def wait_for_event(self):
-        events = self.bot.slack_client.rtm_read()
-        if events and len(events) > 0:
-            for event in events:
-                # print event
-                self.parse_event(event)
+        self.jobs = JobScheduler(self.post_message)
+        self.command = Command(self.jobs)
 
     def parse_event(self, event):
-        if event and 'text' in event:
+        if event and event.get('type') in ('user_change', 'team_join'):
+            user_directory.handle_event(event)
+        elif event and event.get('type') in ('channel_rename', 'group_rename', 'channel_created', 'group_joined'):
+            channel_directory.handle_event(event)
+            if event['type'] in ('channel_rename', 'group_rename'):
+                all_links_page.update(event.get('channel', {}).get('id'))
+        elif event and 'text' in event:
             if self.bot.bot_id in event['text']:
                 self.handle_event(event['user'], event['text'].split(self.bot.bot_id)[1].strip().lower(), event['channel'])
-            elif 'gist.github.com/ElBell' not in event and link_or_attachment(event['text']):
+            elif link_or_attachment(event):
                 add_link(event, event['channel'])
 
     def handle_event(self, user, command, channel):
         if command and channel:
             print("Received command: " + command + " in channel: " + channel + " from user: " + user)
-            response = self.command.handle_command(command, channel)
-            self.bot.slack_client.api_call("chat.postMessage", channel=channel, text=response, as_user=True,
-                                           unfurl_links=False, unfurl_media=False)
+            self.post_message(channel, self.command.handle_command(command, channel))
+
+    def post_message(self, channel, text):
+        self.bot.slack_client.api_call("chat.postMessage", channel=channel, text=text, as_user=True,
+                                       unfurl_links=False, unfurl_media=False)
@@ -0,0 +1,45 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Slack marks links up as <url> or <url|label>; one pass over the text finds all of them
+link_pattern = re.compile(r"<(https?://[^|>\s]+)(?:\|([^>]*))?>")
+# Navi's own gists are never collected
+own_links = ("https://gist.github.com/ElBell", "http://gist.github.com/ElBell")
+bot_subtypes = {"bot_message", "bot_add", "bot_remove", "message_changed", "message_deleted",
+                "channel_join", "channel_leave", "group_join", "group_leave"}
+
+
+def is_bot_message(message: Dict) -> bool:
+    return 'bot_id' in message or message.get('subtype') in bot_subtypes
+
+
+# Rich text link elements can sit at any depth of a block
+def block_links(blocks: List[Dict]):
+    stack = list(reversed(blocks))
+    while stack:
+        element = stack.pop()
+        if element.get('type') == 'link' and element.get('url', '').startswith(('http://', 'https://')):
+            yield element['url'], element.get('text')
+        stack.extend(reversed(element.get('elements', [])))
+
+
+# Every (url, label) in a message, in order, each url once. label is None when the link was posted bare.
+# Slack mirrors rich text blocks into text with the same <url|label> markup, so the blocks are only
+# walked for messages that come without text
+def message_links(message: Dict) -> List[Tuple[str, Optional[str]]]:
+    text = message.get('text')
+    if text:
+        if '<h' not in text:
+            return []
+        links = link_pattern.findall(text)
+    else:
+        links = block_links(message.get('blocks') or [])
+    found: Dict[str, Optional[str]] = {}
+    for url, label in links:
+        if url not in found and not url.startswith(own_links):
+            found[url] = label or None
+    return list(found.items())
+
+
+def has_links(message: Dict) -> bool:
+    return bool(message.get('attachments')) or bool(message_links(message))
@@ -0,0 +1,130 @@
+import io
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import git
+from git import Actor, Commit, IndexFile
+from git.index.typ import BaseIndexEntry
+from gitdb import IStream
+from storage import Storage
+from write_buffer import WriteBuffer
+
+repo_path: str = os.environ.get("NAVI_GIT_REPO", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bare-repo"))
+commit_window: float = float(os.environ.get("NAVI_GIT_COMMIT_WINDOW", 5))
+commit_max_pending: int = int(os.environ.get("NAVI_GIT_COMMIT_MAX_PENDING", 200))
+navi = Actor("Navi", "navi@localhost")
+file_mode = 0o100644
+
+
+# Documents as directories of a bare git repo, <doc_id>/<file name>. Saves land in memory straight
+# away and are committed together, one commit per window however many documents changed. With a
+# mirror, documents that only exist there are pulled in on first read, new documents take the
+# mirror's ids, and each commit's changes are pushed to the mirror in the background
+class GitStorage(Storage):
+    def __init__(self, path=repo_path, mirror: Optional[Storage] = None, window=commit_window,
+                 max_pending=commit_max_pending):
+        self.repo = git.Repo.init(path, bare=True)
+        self.mirror = mirror
+        # saved but not committed yet, read through by load
+        self.staged: Dict[str, Dict[str, str]] = {}
+        self.lock = threading.Lock()
+        self.pushes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mirror") if mirror else None
+        self.buffer = WriteBuffer(self.commit, window, max_pending)
+
+    def directory(self, doc_id):
+        if not self.repo.head.is_valid():
+            return None
+        try:
+            return self.repo.head.commit.tree / doc_id
+        except KeyError:
+            return None
+
+    # Only the named blobs are read when names are given
+    def committed(self, doc_id, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        directory = self.directory(doc_id)
+        if directory is None:
+            return {}
+        wanted = None if names is None else set(names)
+        return {blob.name: blob.data_stream.read().decode('utf-8') for blob in directory.blobs
+                if wanted is None or blob.name in wanted}
+
+    def load(self, doc_id, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        names = None if names is None else list(names)
+        files = self.committed(doc_id, names)
+        with self.lock:
+            staged = self.staged.get(doc_id, {})
+            files.update(staged if names is None else {name: staged[name] for name in names if name in staged})
+        if not files and self.mirror and not self.names(doc_id):
+            files = self.mirror.load(doc_id)
+            self.stage(doc_id, files, push=False)
+            if names is not None:
+                files = {name: files[name] for name in names if name in files}
+        return files
+
+    def names(self, doc_id) -> List[str]:
+        directory = self.directory(doc_id)
+        committed = [blob.name for blob in directory.blobs] if directory is not None else []
+        with self.lock:
+            return list(dict.fromkeys(committed + list(self.staged.get(doc_id, {}))))
+
+    def save(self, doc_id, files: Dict[str, str]):
+        self.stage(doc_id, files, push=True)
+
+    def create(self, files: Dict[str, str], description) -> str:
+        doc_id = self.mirror.create(files, description) if self.mirror else uuid.uuid4().hex
+        self.stage(doc_id, files, push=False)
+        return doc_id
+
+    def url(self, doc_id) -> str:
+        return self.mirror.url(doc_id) if self.mirror else f"file://{os.path.abspath(self.repo.git_dir)}#{doc_id}"
+
+    def file_url(self, doc_id, name) -> str:
+        return self.mirror.file_url(doc_id, name) if self.mirror else f"{self.url(doc_id)}/{name}"
+
+    def stage(self, doc_id, files: Dict[str, str], push):
+        with self.lock:
+            self.staged.setdefault(doc_id, {}).update(files)
+        self.buffer.add("commit", [(doc_id, dict(files), push)])
+
+    def blob(self, content: str) -> bytes:
+        data = content.encode('utf-8')
+        return self.repo.odb.store(IStream('blob', len(data), io.BytesIO(data))).binsha
+
+    # WriteBuffer flush: commits everything staged, which includes anything a failed commit left behind
+    def commit(self, _, updates: List[Tuple[str, Dict[str, str], bool]]):
+        with self.lock:
+            changes = {(doc_id, name): content for doc_id, files in self.staged.items() for name, content in files.items()}
+        if changes:
+            parents = [self.repo.head.commit] if self.repo.head.is_valid() else []
+            index = IndexFile.new(self.repo, *[parent.tree for parent in parents])
+            index.add([BaseIndexEntry((file_mode, self.blob(content), 0, f"{doc_id}/{name}"))
+                       for (doc_id, name), content in changes.items()], write=False)
+            documents = len({doc_id for doc_id, _ in changes})
+            Commit.create_from_tree(self.repo, index.write_tree(), f"Update {documents} documents",
+                                    parent_commits=parents, head=True, author=navi, committer=navi)
+            with self.lock:
+                for (doc_id, name), content in changes.items():
+                    # saved again since the snapshot was taken, that goes in the next commit
+                    if self.staged.get(doc_id, {}).get(name) is content:
+                        del self.staged[doc_id][name]
+                        if not self.staged[doc_id]:
+                            del self.staged[doc_id]
+        pushed: Dict[str, Dict[str, str]] = {}
+        for doc_id, files, push in updates:
+            if push:
+                pushed.setdefault(doc_id, {}).update(files)
+        if pushed and self.pushes:
+            self.pushes.submit(self.push, pushed)
+
+    def push(self, documents: Dict[str, Dict[str, str]]):
+        for doc_id, files in documents.items():
+            try:
+                self.mirror.save(doc_id, files)
+            except Exception as e:
+                print(f"Failed to mirror {doc_id}: {e!r}")
+
+    def flush(self):
+        self.buffer.flush()
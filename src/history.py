@@ -1,28 +1,56 @@
 import os
-import re
-import time
 import json
+import threading
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime
-from typing import List, Dict, Set, Iterator
-import requests
-from bs4 import BeautifulSoup
+from hashlib import sha1
+from queue import Queue
+from typing import List, Dict, Set, Iterator, Iterable, Tuple
 from slackclient import SlackClient
 from simplegist.simplegist import Simplegist
+from titles import TitleResolver
+from directory import UserDirectory, ChannelDirectory
+from write_buffer import WriteBuffer
+from conversations import HistoryClient
+from ratelimit import governor, GovernedSlackClient
+from canonical import canonical_url, UrlIndex
+from extract import message_links, is_bot_message, has_links
+from sections import SectionClassifier, classifiers
+from storage import Storage, open_storage
+from link_index import LinkIndex
+from shards import Manifest, month_key
 
-sections = {"git": "GitHub", "stackoverflow": "StackOverflow", "java": "Java", "python": "Python",
-            "interview": "Interview", "": "Misc"}
-ignored_titles: List[str] = ["not found", "forbidden", "denied"]
 slack_token: str = os.environ["OAUTH_ACCESS_TOKEN"]
-slack_client: SlackClient = SlackClient(slack_token)
+slack_client: GovernedSlackClient = GovernedSlackClient(SlackClient(slack_token), governor)
+user_directory = UserDirectory(slack_client)
+channel_directory = ChannelDirectory(slack_client)
+history_client = HistoryClient(slack_client)
 gist_list_id = "af088f66c27df3e6462a6cd0f2a9071c"
 gist_find_all = "4a06315bf0a5593b9ff2456bcb7ef5fb"
+gist: Simplegist = Simplegist(username='ElBell', api_token=os.environ["GIST_ACCESS_TOKEN"],
+                              rate_limit=governor.gist, on_response=governor.observe_github)
+# Every document (channel json and md, the key index, the find all page) is read and written through here
+storage: Storage = open_storage(gist)
+title_resolver = TitleResolver()
+url_index = UrlIndex()
+link_index = LinkIndex()
+# Links are appended to a per-channel log file in the json gist and only folded into the newest shard,
+# along with a full md re-render, every compact_every links
+compact_every: int = int(os.environ.get("NAVI_COMPACT_EVERY", 50))
+log_suffix = ".log.json"
+# Keep a channel's json and md as files of one gist, so each update is a single atomic PATCH
+single_gist: bool = os.environ.get("NAVI_SINGLE_GIST", "") == "1"
+line_cache_size = 200000
 
 
 class Link:
-    def __init__(self, url, creator, timestamp):
+    # reposts holds the timestamps of later posts of the same canonical url in the channel
+    def __init__(self, url, creator, timestamp, reposts=None, label=None):
         self.url = url
         self.creator = creator
         self.timestamp = timestamp
+        self.reposts: List[str] = reposts or []
+        self.label = label
 
     def __key(self):
         return self.url, self.creator, self.timestamp
@@ -33,68 +61,83 @@ class Link:
     def __eq__(self, other):
         return isinstance(self, type(other)) and self.__key() == other.__key()
 
+    @property
+    def posts(self):
+        return 1 + len(self.reposts)
+
     def to_json(self):
-        return {
+        data = {
             'url': self.url,
             'creator': self.creator,
             'timestamp': self.timestamp
         }
+        if self.reposts:
+            data['reposts'] = self.reposts
+        if self.label:
+            data['label'] = self.label
+        return data
 
     @classmethod
     def from_json(cls, data):
         return cls(data['url'],
                    data['creator'],
-                   data['timestamp'])
+                   data['timestamp'],
+                   data.get('reposts'),
+                   data.get('label'))
 
 
 # Get users for mapping onto their ids
 def get_users():
-    raw_users = slack_client.api_call("users.list")
-    users = {}
-    for user in raw_users['members']:
-        if 'profile' in user:
-            users[user['id']] = user['profile']['real_name']
-    return users
-
-
-# Get messages
-def get_messages(channel_id):
-    all_messages = []
-    has_more = True
-    latest = datetime.now().timestamp()
-    call = "channels.history" if channel_id[0] == "C" else "groups.history"
-    while has_more:
-        current = slack_client.api_call(call, channel=channel_id, latest=latest, count=1000)
-        if not current['ok'] and current['error'] == 'ratelimited':
-            time.sleep(int(current['headers']['Retry-After']))
-        else:
-            try:
-                all_messages += current['messages']
-                has_more = current['has_more']
-                latest = all_messages[len(all_messages) - 1]['ts']
-            except:
-                print(current)
-    return all_messages
+    return user_directory
 
 
-# get link from message text
-def parse_message(message):
-    message_text = message['text']
-    if is_link(message_text):
-        url = message_text[message_text.index('<') + 1:message_text.index('>')]
-        return [Link(url, message['user'], message['ts'])]
+# Get messages, one page at a time, newest first and stopping at oldest when given
+def get_message_pages(channel_id, oldest=None) -> Iterator[List[Dict]]:
+    return history_client.pages(channel_id, oldest=oldest)
 
 
-def is_link(text):
-    if len(text) > 0 and '<' in text and text[text.index('<') + 1] == 'h' and 'gist.github.com/ElBell' not in text:
-        return True
-    return False
+# Runs the iterator on its own thread, staying at most depth items ahead of the consumer. When the
+# consumer stops early, or fails, the producer is let go instead of blocking on a full queue
+def prefetch(items: Iterable, depth=1) -> Iterator:
+    queue = Queue(maxsize=depth)
+    done = object()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if stopped.is_set():
+                    return
+                queue.put((item, None))
+            queue.put((done, None))
+        except Exception as e:
+            queue.put((done, e))
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+    try:
+        while True:
+            item, error = queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        # frees a producer blocked on put, it sees stopped before its next one
+        while not queue.empty():
+            queue.get_nowait()
+
+
+# get links from message text and rich text blocks
+def parse_message(message):
+    return [Link(url, message['user'], message['ts'], label=label) for url, label in message_links(message)]
 
 
 # get links from attachments
 def parse_attachments(message):
     attachment_links = []
-    for attachment in message['attachments']:
+    for attachment in message.get('attachments', []):
         if 'original_url' in attachment:
             attachment_links.append(Link(attachment['original_url'], message['user'], message['ts']))
         if 'app_unfurl_url' in attachment:
@@ -102,59 +145,178 @@ def parse_attachments(message):
     return attachment_links
 
 
-def sort_into_sections(links_set: Iterator[Link]):
-    sectioned_links = {sections[section]: [] for section in sections.keys()}
+# Every link goes into exactly one section, the first one the channel's rules give it
+def sort_into_sections(links_set: Iterable[Link], classifier: SectionClassifier = None):
+    classifier = classifier or classifiers.get()
+    sectioned_links = {section: [] for section in classifier.sections}
     for link in links_set:
-        sectioned_links[get_section(link)].append(link)
+        sectioned_links[classifier.classify(link.url)].append(link)
     return sectioned_links
 
 
-def get_section(link):
-    for key, title in sections.items():
-        if key in link.url:
-            return title
+def link_or_attachment(message):
+    return not is_bot_message(message) and has_links(message)
 
 
-def link_or_attachment(raw_message):
-    if 'attachments' in raw_message or is_link(raw_message):
-        return True
-    return False
+def extract_links(pages: Iterable[List[Dict]]) -> Iterator[Link]:
+    for page in pages:
+        for message in page:
+            if link_or_attachment(message):
+                yield from parse_link_or_attachment(message)
 
 
-def get_links(raw_messages):
-    links_set: Set[Link] = set()
-    for message in [raw_message for raw_message in raw_messages if 'navi' not in str(raw_message).lower()]:
-        links: List[Link] = parse_link_or_attachment(message)
-        if links is not None:
-            links_set.update(links)
-    return sort_into_sections(links_set)
+# Folds every post of the same canonical url into its earliest one, which remembers when the others were.
+# A message carrying the url twice (text and unfurl) still counts as one post. Links read back from json
+# may already carry reposts, those are kept
+def collapse(links: Iterable[Link]) -> List[Link]:
+    firsts: Dict[str, Link] = {}
+    seen = set()
+    for link in links:
+        key = canonical_url(link.url)
+        if (key, link.timestamp) in seen:
+            continue
+        seen.add((key, link.timestamp))
+        first = firsts.get(key)
+        if first is None:
+            firsts[key] = link
+            continue
+        earlier, later = (link, first) if float(link.timestamp) < float(first.timestamp) else (first, link)
+        reposts = set(earlier.reposts + later.reposts + [later.timestamp]) - {earlier.timestamp}
+        earlier.reposts = sorted(reposts, key=float)
+        later.reposts = []
+        firsts[key] = earlier
+    return list(firsts.values())
+
+
+# Every post of the links, reposts as links of their own
+def all_posts(links: Iterable[Link]) -> List[Link]:
+    return [post for link in links for post in [link] + [Link(link.url, link.creator, ts) for ts in link.reposts]]
+
+
+# Remembers the newest message ts that went through a page stream, and reports how far along it is
+class HighWater:
+    def __init__(self, ts=None, progress=None):
+        self.ts = ts
+        self.progress = progress
+        self.messages = 0
+
+    def track(self, pages: Iterable[List[Dict]]) -> Iterator[List[Dict]]:
+        for page in pages:
+            for message in page:
+                if self.ts is None or float(message['ts']) > float(self.ts):
+                    self.ts = message['ts']
+            self.messages += len(page)
+            if self.progress:
+                self.progress(f"{self.messages} messages read")
+            yield page
+
+
+# Backfill pipeline: the next page is fetched while links are pulled out of the current one,
+# so only a page or two of raw messages is ever held in memory. Every post is returned, reposts
+# included, for the caller to record and collapse
+def stream_links(channel_id, high_water=None) -> List[Link]:
+    high_water = high_water or HighWater()
+    pages = high_water.track(get_message_pages(channel_id, oldest=high_water.ts))
+    return list(extract_links(prefetch(pages)))
+
+
+# Titles are fetched once per canonical url. The caller resolves them in bulk when rendering a whole
+# file, otherwise they are fetched here
+def link_title(link: Link, title=None):
+    if title is None:
+        title = title_resolver.resolve(canonical_url(link.url))
+    if link.label and title == canonical_url(link.url):
+        # no title could be fetched, the poster's own label is the next best thing
+        return link.label
+    return title
+
+
+# first_shared names the channel the url was posted in first, when that is another channel
+def generate_link_md(link: Link, users, title=None, first_shared=None):
+    title = link_title(link, title)
+    reposts = [f"posted {link.posts} times"] if link.posts > 1 else []
+    reposts += [f"first shared in #{first_shared}"] if first_shared else []
+    return f"[{title}]({link.url})<br/>By: {users[link.creator]} " \
+        f"Posted: {datetime.fromtimestamp(float(link.timestamp)).strftime('%b %d %Y %I:%M:%S%p')} " \
+        f"{'(' + ', '.join(reposts) + ') ' if reposts else ''}<br/> "
+
+
+# Rendered md lines, keyed by everything that goes into one: the link, how often it was posted, the
+# creator's display name, the title and where the url was first shared. A line is only formatted
+# again when one of those changes
+class LineCache:
+    def __init__(self, size=line_cache_size):
+        self.size = size
+        self.lines: Dict[tuple, str] = {}
+
+    def line(self, link: Link, users, title, first_shared=None) -> str:
+        key = (link.url, link.creator, link.timestamp, link.posts, link.label, users[link.creator], title, first_shared)
+        line = self.lines.get(key)
+        if line is None:
+            if len(self.lines) >= self.size:
+                self.lines.clear()
+            line = self.lines[key] = generate_link_md(link, users, title, first_shared)
+        return line
+
+
+line_cache = LineCache()
+
+
+# canonical url -> name of the channel it was first posted in, for urls that came from elsewhere.
+# A channel Slack can no longer find (deleted, or the bot was removed) just leaves the note out
+def first_shared_elsewhere(canonicals: Iterable[str], channel_id) -> Dict[str, str]:
+    names = {}
+    for key, first in url_index.first_channels(canonicals).items():
+        if first != channel_id:
+            try:
+                names[key] = get_channel_name(first)
+            except Exception as e:
+                print(f"No name for channel {first}: {e!r}")
+    return names
 
 
-# Getting the possible title from the link using Beautiful Soup
-def generate_link_md(link: Link, users):
-    try:
-        title = BeautifulSoup(requests.get(link.url).text, 'lxml').title.string
-        if any(word in title.lower() for word in ignored_titles):
-            title = link.url
-    except:
-        title = link.url
-    title = re.sub(r"[\n\t]*", "", title).strip()
-    return f"[{title.strip()}]({link.url})<br/>By: {users[link.creator]} " \
-        f"Posted: {datetime.fromtimestamp(float(link.timestamp)).strftime('%b %d %Y %I:%M:%S%p')} <br/> "
+def render_sections(sectioned_links, users, channel_id) -> Dict[str, List[str]]:
+    links = [link for links in sectioned_links.values() for link in links]
+    titles = title_resolver.resolve_all(canonical_url(link.url) for link in links)
+    elsewhere = first_shared_elsewhere(titles, channel_id)
+    rendered = {}
+    for title, links in sectioned_links.items():
+        links.sort(key=lambda x: x.timestamp)
+        rendered[title] = [line_cache.line(link, users, titles[canonical_url(link.url)],
+                                           elsewhere.get(canonical_url(link.url))) for link in links]
+    return rendered
 
 
-def generate_md_file(sectioned_links, channel_id):
-    users = get_users()
-    md_file = [f"# {get_channel_name(channel_id)}"]
-    for title, links in sectioned_links.items():
-        if len(links) > 0:
+# Rows for sections that aren't being rendered: only titles already cached are used, nothing is fetched
+def index_sections(channel_id, sectioned_links):
+    titles = title_resolver.cached(canonical_url(link.url) for links in sectioned_links.values() for link in links)
+    link_index.put(channel_id, [(link, section, link_title(link, titles.get(canonical_url(link.url),
+                                                                            canonical_url(link.url))))
+                                for section, links in sectioned_links.items() for link in links])
+
+
+# Bring the search index in line with a channel's sections. titles maps canonical urls to fetched titles
+def index_channel(channel_id, sectioned_links, titles=None):
+    if titles is None:
+        titles = title_resolver.resolve_all(canonical_url(link.url)
+                                            for links in sectioned_links.values() for link in links)
+    link_index.replace_channel(channel_id, [(link, section, link_title(link, titles[canonical_url(link.url)]))
+                                            for section, links in sectioned_links.items() for link in links])
+
+
+def assemble_md(channel_name, rendered_sections):
+    md_file = [f"# {channel_name}"]
+    for title, lines in rendered_sections.items():
+        if len(lines) > 0:
             md_file.append(f"\n## {title}<br/>\n")
-            links.sort(key=lambda x: x.timestamp)
-            for link in links:
-                md_file.append(generate_link_md(link, users))
+            md_file += lines
     return ''.join(md_file)
 
 
+def generate_md_file(sectioned_links, channel_id):
+    return assemble_md(get_channel_name(channel_id), render_sections(sectioned_links, get_users(), channel_id))
+
+
 def original_json(sectioned_links):
     json_data = {category: [link.to_json() for link in links]
                  for category, links in sectioned_links.items()}
@@ -162,71 +324,507 @@ def original_json(sectioned_links):
 
 
 def get_link_to_links(channel_id):
-    gist = Simplegist(username='ElBell', api_token=os.environ["GIST_ACCESS_TOKEN"])
-    keys = json.loads(gist.profile().content(id=gist_list_id))
-    return f"https://gist.github.com/ElBell/{keys[channel_id][1]}"
+    return storage.url(read_keys()[channel_id][1])
 
 
 def get_link_to_all():
-    return f"https://gist.github.com/ElBell/{gist_find_all}"
+    return storage.url(gist_find_all)
 
 
-def get_channel_name(channel_id):
-    if channel_id[0] == "C":
-        return slack_client.api_call("channels.info", channel=channel_id)["channel"]["name"]
-    else:
-        return slack_client.api_call("groups.info", channel=channel_id)["group"]["name"]
+# The key index and the find all page are documents of a single file, which keeps whatever name it has
+def read_single(doc_id, default):
+    return next(iter(storage.load(doc_id).values()), default)
 
 
-def parse_link_or_attachment(message: str) -> List[Link]:
-    if 'attachments' in message:
-        return parse_attachments(message)
-    elif 'text' in message:
-        return parse_message(message)
+def write_single(doc_id, content, default_name):
+    storage.save(doc_id, {next(iter(storage.load(doc_id)), default_name): content})
 
 
+# The key index holds [json document, md document, newest message ts ingested] per channel.
+# Channels indexed before the mark was kept have no third entry and are re-read in full
+def read_keys() -> Dict[str, List]:
+    return json.loads(read_single(gist_list_id, "{}"))
+
+
+def write_keys(keys):
+    write_single(gist_list_id, json.dumps(keys), "keys.json")
+
+
+# Jobs for different channels run side by side, so the key index is re-read under the lock and only
+# the one channel's entry is changed, instead of writing back a copy another job may have moved past
+keys_lock = threading.Lock()
+
+
+def set_keys(channel_id, entry: List):
+    with keys_lock:
+        keys = read_keys()
+        if keys.get(channel_id) != entry:
+            keys[channel_id] = entry
+            write_keys(keys)
+
+
+def get_channel_name(channel_id):
+    return channel_directory[channel_id]
+
+
+# Unfurls usually repeat a link from the text, those are told apart by canonical url
+def parse_link_or_attachment(message: Dict) -> List[Link]:
+    links = {}
+    for link in parse_message(message) + parse_attachments(message):
+        links.setdefault(canonical_url(link.url), link)
+    return list(links.values())
+
+
+# md page of one shard
+def shard_md(channel_name, key, rendered_sections):
+    return assemble_md(f"{channel_name} {key}", rendered_sections)
+
+
+# The channel's md index page, linking to every shard's page, newest first
+def index_md(channel_name, manifest: Manifest, md_id):
+    return f"# {channel_name}<br/>\n" + ''.join(
+        f"[{shard['key']}]({storage.file_url(md_id, manifest.md_name(shard['key']))}) {shard['links']} links<br/>\n"
+        for shard in reversed(manifest.shards))
+
+
+# json and md files of whole shards, each given as (key, sectioned links)
+def shard_files(channel_id, manifest: Manifest, shards) -> Tuple[Dict[str, str], Dict[str, str]]:
+    channel_name, users = get_channel_name(channel_id), get_users()
+    json_files = {manifest.json_name(key): json.dumps(original_json(sectioned)) for key, sectioned in shards}
+    md_files = {manifest.md_name(key): shard_md(channel_name, key, render_sections(sectioned, users, channel_id))
+                for key, sectioned in shards}
+    return json_files, md_files
+
+
+# Saves whole shards along with the manifest and the md index page
+def write_shards(channel_id, keys, json_name, md_name, manifest: Manifest, shards):
+    json_files, md_files = shard_files(channel_id, manifest, shards)
+    json_files[json_name] = json.dumps(manifest.to_json())
+    md_files[md_name] = index_md(get_channel_name(channel_id), manifest, keys[1])
+    edits = {keys[0]: json_files}
+    edits.setdefault(keys[1], {}).update(md_files)
+    for doc_id, files in edits.items():
+        storage.save(doc_id, files)
+
+
+def read_sections(data) -> Dict[str, List[Link]]:
+    return {category: [Link.from_json(link) for link in links] for category, links in data.items()}
+
+
+# All shards' sections as one, for the search index
+def merge_sections(shards) -> Dict[str, List[Link]]:
+    merged: Dict[str, List[Link]] = {}
+    for _, sectioned in shards:
+        for section, links in sectioned.items():
+            merged.setdefault(section, []).extend(links)
+    return merged
+
+
+# In-memory view of a channel's newest shard, kept between messages so a new link costs one delta write
+# to the log file and one md write with a single freshly rendered line. What is sent stays small however
+# long the channel's history, but a gist is one document: GitHub answers every PATCH with all of its
+# files, older shards included, so with the gist backend each write still receives the whole history
+# (cut off at 1MB a file). Only the git backend reads and writes single files. The log holds raw posts,
+# a shard's json one link per canonical url with its reposts
+class ChannelState:
+    def __init__(self, channel_id, keys, json_name, md_name, manifest: Manifest, sectioned_links):
+        self.channel_id = channel_id
+        self.json_id = keys[0]
+        self.md_id = keys[1]
+        self.json_name = json_name
+        self.log_name = json_name[:-len(".json")] + log_suffix
+        self.md_name = md_name
+        self.manifest = manifest
+        self.classifier = classifiers.get(channel_id)
+        self.channel_name = get_channel_name(channel_id)
+        self.start(sectioned_links)
+        self.index(self.firsts)
+
+    @property
+    def key(self):
+        return self.manifest.newest['key'] if self.manifest.newest else None
+
+    def start(self, sectioned_links):
+        # each section stays sorted by timestamp from here on, new links are bisected into place
+        self.sectioned_links: Dict[str, List[Link]] = sort_into_sections(
+            dict.fromkeys(link for links in sectioned_links.values() for link in links), self.classifier)
+        for links in self.sectioned_links.values():
+            links.sort(key=lambda x: x.timestamp)
+        self.timestamps = {title: [link.timestamp for link in links] for title, links in self.sectioned_links.items()}
+        # canonical url -> fetched title, and -> the other channel it was first shared in (or None)
+        self.titles: Dict[str, str] = {}
+        self.first_shared: Dict[str, str] = {}
+        self.pending: List[Link] = []
+        self.firsts: Dict[str, Link] = {canonical_url(link.url): link
+                                        for links in self.sectioned_links.values() for link in links}
+        self.seen = {(key, ts) for key, link in self.firsts.items() for ts in [link.timestamp] + link.reposts}
+        # posts from before this are looked up in the url index, they may be in an older shard
+        self.since = min((float(link.timestamp) for link in self.firsts.values()), default=None)
+        self.render()
+
+    # Only titles not known yet, or that couldn't be fetched last time, are looked up again, and
+    # unchanged lines come out of the line cache
+    def render(self):
+        keys = {canonical_url(link.url) for links in self.sectioned_links.values() for link in links}
+        self.titles.update(title_resolver.resolve_all(key for key in keys if self.titles.get(key, key) == key))
+        unknown = [key for key in keys if key not in self.first_shared]
+        self.first_shared.update(dict.fromkeys(unknown))
+        self.first_shared.update(first_shared_elsewhere(unknown, self.channel_id))
+        users = get_users()
+        self.rendered = {title: [self.line(link, users) for link in links]
+                         for title, links in self.sectioned_links.items()}
+
+    def line(self, link: Link, users):
+        key = canonical_url(link.url)
+        if key not in self.titles:
+            self.titles[key] = title_resolver.resolve(key)
+        if key not in self.first_shared:
+            self.first_shared[key] = first_shared_elsewhere([key], self.channel_id).get(key)
+        return line_cache.line(link, users, self.titles[key], self.first_shared[key])
+
+    # Same order a full re-render would give: stable timestamp sort puts a new link after its equals.
+    # A repost only bumps the count on the line of the url's first post in this shard. Posts are taken
+    # oldest first, history pages come newest first. Replaying the log skips the url index, whose
+    # posts the log was written from
+    def insert(self, links: List[Link], check_index=True) -> List[Link]:
+        links = sorted(links, key=lambda x: float(x.timestamp))
+        older = [link for link in links if self.since is None or float(link.timestamp) < self.since]
+        known = url_index.known(self.channel_id, older) if check_index and older and len(self.manifest.shards) > 1 \
+            else set()
+        added, posts = [], set()
+        for link in links:
+            post = (canonical_url(link.url), link.timestamp)
+            if post not in self.seen and post not in known and post not in posts:
+                posts.add(post)
+                added.append(link)
+        if added:
+            url_index.record(self.channel_id, added)
+            users = get_users()
+            changed = {}
+            for link in added:
+                key = canonical_url(link.url)
+                self.seen.add((key, link.timestamp))
+                if key not in self.firsts:
+                    original = self.repost_of_older(key, link)
+                    if original is not None:
+                        self.pending.append(Link(link.url, link.creator, link.timestamp, label=link.label))
+                        changed[key] = original
+                        continue
+                    next_key = self.manifest.next_key(link.timestamp)
+                    if next_key:
+                        self.roll_over(next_key, changed)
+                self.pending.append(Link(link.url, link.creator, link.timestamp, label=link.label))
+                if key in self.firsts:
+                    self.firsts[key].reposts.append(link.timestamp)
+                    self.rerender(self.firsts[key], users)
+                    changed[key] = self.firsts[key]
+                    continue
+                self.firsts[key] = changed[key] = link
+                self.since = min(self.since or float(link.timestamp), float(link.timestamp))
+                self.manifest.newest['links'] = len(self.firsts)
+                title = self.classifier.classify(link.url)
+                position = bisect_right(self.timestamps.setdefault(title, []), link.timestamp)
+                self.timestamps[title].insert(position, link.timestamp)
+                self.sectioned_links.setdefault(title, []).insert(position, link)
+                self.rendered.setdefault(title, []).insert(position, self.line(link, users))
+            self.index(changed)
+        return added
+
+    # The newest shard is written out whole and a new, empty one takes its place
+    def roll_over(self, key, changed: Dict[str, Link]):
+        self.index(changed)
+        changed.clear()
+        if self.key is not None:
+            compact_channel(self)
+        self.manifest.start(key)
+        self.start({})
+
+    # A url first posted in an older shard keeps its line there: the post is added to that link's reposts
+    # and the one shard is rewritten. Returns the original, or None when the url is new to the channel
+    def repost_of_older(self, key, link: Link):
+        first = url_index.first_post(self.channel_id, key)
+        if first is None or float(first) >= float(link.timestamp) or len(self.manifest.shards) < 2:
+            return None
+        older = [shard['key'] for shard in reversed(self.manifest.shards[:-1])]
+        if self.manifest.by == "month":
+            # most likely the shard of the month it was first posted in
+            older.sort(key=lambda shard_key: shard_key != month_key(first))
+        for shard_key in older:
+            name = self.manifest.json_name(shard_key)
+            sectioned = read_sections(json.loads(storage.load(self.json_id, [name]).get(name, "{}")))
+            for links in sectioned.values():
+                for original in links:
+                    if canonical_url(original.url) == key:
+                        if link.timestamp not in original.reposts:
+                            original.reposts = sorted(original.reposts + [link.timestamp], key=float)
+                            write_shards(self.channel_id, [self.json_id, self.md_id], self.json_name, self.md_name,
+                                         self.manifest, [(shard_key, sectioned)])
+                        return original
+        return None
+
+    def index(self, links: Dict[str, Link]):
+        link_index.put(self.channel_id, [(link, self.classifier.classify(link.url),
+                                          link_title(link, self.titles.get(key))) for key, link in links.items()])
+
+    def rerender(self, link: Link, users):
+        line = self.line(link, users)
+        for title, timestamps in self.timestamps.items():
+            for position in range(bisect_left(timestamps, link.timestamp), bisect_right(timestamps, link.timestamp)):
+                if self.sectioned_links[title][position] is link:
+                    self.rendered[title][position] = line
+
+    def md(self):
+        return shard_md(self.channel_name, self.key, self.rendered)
+
+    # One save per document touched: just one when the json and md share a gist. The manifest and the
+    # md index page are small and go along with every write
+    def write(self, json_files: Dict[str, str]):
+        edits = {self.json_id: dict(json_files, **{self.json_name: json.dumps(self.manifest.to_json())})}
+        md_files = edits.setdefault(self.md_id, {})
+        md_files[self.md_name] = index_md(self.channel_name, self.manifest, self.md_id)
+        if self.key is not None:
+            md_files[self.manifest.md_name(self.key)] = self.md()
+        for doc_id, files in edits.items():
+            storage.save(doc_id, files)
+
+
+channel_states: Dict[str, ChannelState] = {}
+
+
+# A document's main json or md file is the one named after the channel alone, <channel>.json or
+# <channel>.md. Channel names have no dots, shard and log files have a second one
+def main_file(names: Iterable[str], suffix):
+    return next((name for name in names if name.endswith(suffix) and name.count(".") == 1), None)
+
+
+# Only the manifest, the log and the newest shard are read
+def load_channel_state(channel_id) -> ChannelState:
+    keys = read_keys()[channel_id]
+    names = storage.names(keys[0])
+    json_name = main_file(names, ".json")
+    md_name = main_file(names, ".md") or main_file(storage.names(keys[1]), ".md")
+    log_name = json_name[:-len(".json")] + log_suffix
+    files = storage.load(keys[0], [json_name, log_name])
+    data = json.loads(files[json_name])
+    if Manifest.is_manifest(data):
+        manifest = Manifest.from_json(json_name[:-len(".json")], data)
+        newest = manifest.json_name(manifest.newest['key']) if manifest.newest else None
+        sectioned_links = read_sections(json.loads(storage.load(keys[0], [newest]).get(newest, "{}"))) if newest else {}
+        if not link_index.has_channel(channel_id):
+            restore_indexes(channel_id, keys[0], manifest, sectioned_links)
+    else:
+        manifest, sectioned_links = shard_channel(channel_id, keys, json_name, md_name, data)
+    state = ChannelState(channel_id, keys, json_name, md_name, manifest, sectioned_links)
+    state.insert([Link.from_json(link) for link in json.loads(files.get(log_name, "[]"))], check_index=False)
+    return state
+
+
+# The url and search indexes are local files, which an ephemeral disk loses on every restart. A channel
+# with nothing in the search index gets every shard's posts read back into the url index, and the older
+# shards' rows into the search index. The title cache went with the same disk, so those rows take the
+# titles still cached and otherwise the label or url, rather than fetching every page of the history
+# again. A shard's rows get their fetched titles the next time it is rendered
+def restore_indexes(channel_id, json_id, manifest: Manifest, newest_links):
+    names = [manifest.json_name(shard['key']) for shard in manifest.shards[:-1]]
+    shards = [read_sections(json.loads(content)) for content in storage.load(json_id, names).values()]
+    url_index.record(channel_id, all_posts(link for sectioned in shards + [newest_links]
+                                           for links in sectioned.values() for link in links))
+    for sectioned in shards:
+        index_sections(channel_id, sectioned)
+
+
+# Channels stored before sharding keep every link in their main json file. They are split into
+# shards once, and the main files become the manifest and the md index page. Returns the manifest
+# and the newest shard's sections. Older files list some links under more than one section, and
+# reposts saved before canonical urls as links of their own, so everything is collapsed first
+def shard_channel(channel_id, keys, json_name, md_name, data):
+    links = collapse(dict.fromkeys(link for links in read_sections(data).values() for link in links))
+    url_index.record(channel_id, all_posts(links))
+    manifest = Manifest(json_name[:-len(".json")])
+    classifier = classifiers.get(channel_id)
+    shards = [(key, sort_into_sections(shard, classifier)) for key, shard in manifest.split(links)]
+    write_shards(channel_id, keys, json_name, md_name, manifest, shards)
+    index_channel(channel_id, merge_sections(shards))
+    return manifest, shards[-1][1] if shards else {}
+
+
+def get_channel_state(channel_id) -> ChannelState:
+    if channel_id not in channel_states:
+        channel_states[channel_id] = load_channel_state(channel_id)
+    return channel_states[channel_id]
+
+
+# New links are queued and written per channel in batches, see write_links
 def add_link(message, channel_id):
-    gist = Simplegist(username='ElBell', api_token=os.environ["GIST_ACCESS_TOKEN"])
-    keys = json.loads(gist.profile().content(id=gist_list_id))[channel_id]
-    json_data = json.loads(gist.profile().content(id=keys[0]))
-    sectioned_links = {category: [Link.from_json(link) for link in links] for category, links in json_data.items()}
     new_links: List[Link] = parse_link_or_attachment(message)
-    sectioned_links = add_to_section(new_links, sectioned_links)
-    json_data = {category: [link.to_json() for link in links] for category, links in sectioned_links.items()}
-    gist.profile().edit(id=keys[0], content=json.dumps(json_data))
-    gist.profile().edit(id=keys[1], content=generate_md_file(sectioned_links, channel_id))
+    if new_links:
+        write_buffer.add(channel_id, new_links)
 
 
-def add_to_section(links, sectioned_links):
-    for link in links:
-        for key, title in sections.items():
-            if key in link.url:
-                sectioned_links[title].append(link)
-    return sectioned_links
+# Channels whose gists get_history is rebuilding right now
+rebuilding: Set[str] = set()
+
+
+def write_links(channel_id, new_links: List[Link]):
+    if channel_id in rebuilding:
+        # only an explicit flush gets here, the buffer holds the channel's links until the rebuild is done
+        write_buffer.add(channel_id, new_links)
+        return
+    state = get_channel_state(channel_id)
+    if not state.insert(new_links):
+        return
+    if len(state.pending) >= compact_every:
+        compact_channel(state)
+    else:
+        state.write({state.log_name: json.dumps([link.to_json() for link in state.pending])})
+
+
+write_buffer = WriteBuffer(write_links)
 
 
-def get_history(channel_id):
-    gist = Simplegist(username='ElBell', api_token=os.environ["GIST_ACCESS_TOKEN"])
-    sectioned_links = get_links(get_messages(channel_id))
-    json_file = gist.create(name=get_channel_name(channel_id) + ".json", description="json for channel links",
-                            content=json.dumps(original_json(sectioned_links)))
-    md_file = gist.create(name=get_channel_name(channel_id) + ".md", description="Collected links of channel",
-                          content=generate_md_file(sectioned_links, channel_id))
-    keys = json.loads(gist.profile().content(id=gist_list_id))
-    keys[channel_id] = [json_file['id'], md_file['id']]
-    gist.profile().edit(id=gist_list_id, content=json.dumps(keys))
-    get_all_links()
-    return md_file['Gist-Link']
+# Waits out a flush that is already writing to the channel's state. The channel's links then stay
+# in the buffer until stop_rebuilding
+def start_rebuilding(channel_id):
+    with write_buffer.flush_lock:
+        rebuilding.add(channel_id)
+        write_buffer.pause(channel_id)
 
 
-def get_all_links():
-    gist = Simplegist(username='ElBell', api_token=os.environ["GIST_ACCESS_TOKEN"])
-    keys = json.loads(gist.profile().content(id=gist_list_id))
-    gist.profile().edit(id=gist_find_all, content=generate_all(keys))
+def stop_rebuilding(channel_id):
+    rebuilding.discard(channel_id)
+    write_buffer.resume(channel_id)
 
 
-def generate_all(keys):
-    file = []
-    for channel_id in sorted(keys.keys()):
-        file.append(f"[{get_channel_name(channel_id)}](https://gist.github.com/ElBell/{keys[channel_id][1]})<br/>")
-    return "# .All links<br/>\n" + ''.join(sorted(file))
+# Fold the log back into the newest shard's json file and re-render its whole md page
+def compact_channel(state: ChannelState):
+    state.pending = []
+    state.render()
+    json_files = {state.log_name: "[]"}
+    if state.key is not None:
+        json_files[state.manifest.json_name(state.key)] = json.dumps(original_json(state.sectioned_links))
+    state.write(json_files)
+
+
+# Re-read the section rules and re-file a channel's links under them, in every shard. The channel's
+# gists are rewritten straight away when we have them
+def reload_sections(channel_id):
+    classifiers.reload(channel_id)
+    write_buffer.flush(channel_id)
+    start_rebuilding(channel_id)
+    try:
+        channel_states.pop(channel_id, None)
+        if channel_id in read_keys():
+            state = get_channel_state(channel_id)
+            compact_channel(state)
+            shards = []
+            for shard in state.manifest.shards[:-1]:
+                name = state.manifest.json_name(shard['key'])
+                sectioned = read_sections(json.loads(storage.load(state.json_id, [name]).get(name, "{}")))
+                shards.append((shard['key'], sort_into_sections(
+                    [link for links in sectioned.values() for link in links], state.classifier)))
+            write_shards(channel_id, [state.json_id, state.md_id], state.json_name, state.md_name, state.manifest, shards)
+            index_channel(channel_id, merge_sections(shards + [(state.key, state.sectioned_links)]))
+    finally:
+        stop_rebuilding(channel_id)
+
+
+# Channels we already have gists for are re-synced in place from their high-water mark,
+# new ones get a full backfill into fresh gists
+def get_history(channel_id, progress=None):
+    write_buffer.discard(channel_id)
+    start_rebuilding(channel_id)
+    try:
+        keys = read_keys()
+        if channel_id in keys:
+            return resync_channel(channel_id, keys, progress)
+        return rebuild_channel(channel_id, progress)
+    finally:
+        stop_rebuilding(channel_id)
+
+
+def resync_channel(channel_id, keys, progress=None):
+    state = get_channel_state(channel_id)
+    high_water = HighWater(keys[channel_id][2] if len(keys[channel_id]) > 2 else None, progress)
+    if state.insert(list(stream_links(channel_id, high_water))):
+        compact_channel(state)
+    if keys[channel_id][2:] != [high_water.ts]:
+        set_keys(channel_id, [state.json_id, state.md_id, high_water.ts])
+    all_links_page.update(channel_id, state.md_id)
+    return storage.url(state.md_id)
+
+
+def rebuild_channel(channel_id, progress=None):
+    high_water = HighWater(progress=progress)
+    posts = stream_links(channel_id, high_water)
+    url_index.record(channel_id, posts)
+    classifier = classifiers.get(channel_id)
+    links = collapse(posts)
+    channel_name = get_channel_name(channel_id)
+    manifest = Manifest(channel_name)
+    shards = [(key, sort_into_sections(shard, classifier)) for key, shard in manifest.split(links)]
+    json_files, md_files = shard_files(channel_id, manifest, shards)
+    json_files[channel_name + ".json"] = json.dumps(manifest.to_json())
+    # the index page links to the other pages, so it is only filled in once the md document has an id
+    md_files[channel_name + ".md"] = assemble_md(channel_name, {})
+    index_channel(channel_id, sort_into_sections(links, classifier))
+    if single_gist:
+        json_id = md_id = storage.create(dict(json_files, **md_files), "Collected links of channel")
+    else:
+        json_id = storage.create(json_files, "json for channel links")
+        md_id = storage.create(md_files, "Collected links of channel")
+    storage.save(md_id, {channel_name + ".md": index_md(channel_name, manifest, md_id)})
+    set_keys(channel_id, [json_id, md_id, high_water.ts])
+    channel_states.pop(channel_id, None)
+    all_links_page.update(channel_id, md_id)
+    return storage.url(md_id)
+
+
+# The find all page, kept as its sorted lines, one per channel. Built from the key index once, then
+# only the channel that changed is updated, with names from the channel directory. The page is only
+# saved when its content hash changes
+class AllLinksPage:
+    def __init__(self):
+        self.lines: Dict[str, str] = {}
+        self.md_ids: Dict[str, str] = {}
+        self.sorted_lines: List[str] = []
+        self.digest = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if not self.loaded:
+            for channel_id, keys in read_keys().items():
+                self.set_line(channel_id, keys[1])
+            self.digest = sha1(read_single(gist_find_all, "").encode('utf-8')).hexdigest()
+            self.loaded = True
+
+    def set_line(self, channel_id, md_id):
+        line = f"[{get_channel_name(channel_id)}]({storage.url(md_id)})<br/>"
+        old = self.lines.get(channel_id)
+        if old == line:
+            return
+        if old is not None:
+            del self.sorted_lines[bisect_left(self.sorted_lines, old)]
+        insort(self.sorted_lines, line)
+        self.lines[channel_id] = line
+        self.md_ids[channel_id] = md_id
+
+    def content(self):
+        return "# .All links<br/>\n" + ''.join(self.sorted_lines)
+
+    # md_id defaults to the channel's current md document, e.g. after a rename
+    def update(self, channel_id, md_id=None):
+        with self.lock:
+            self.load()
+            md_id = md_id or self.md_ids.get(channel_id)
+            if md_id is None:
+                return
+            self.set_line(channel_id, md_id)
+            content = self.content()
+            digest = sha1(content.encode('utf-8')).hexdigest()
+            if digest != self.digest:
+                write_single(gist_find_all, content, "all_links.md")
+                self.digest = digest
+
+
+all_links_page = AllLinksPage()
@@ -0,0 +1,109 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Tuple
+
+job_workers: int = int(os.environ.get("NAVI_JOB_WORKERS", 4))
+finished_kept = 20
+
+
+class Job:
+    ids = itertools.count(1)
+
+    def __init__(self, name, channel_id, report=None):
+        self.id = next(Job.ids)
+        self.name = name
+        self.channel_id = channel_id
+        self.report = report
+        self.state = "queued"
+        self.progress = ""
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    def describe(self, channel_name):
+        if self.state == "queued":
+            timing = f"queued for {int(time.time() - self.submitted_at)}s"
+        elif self.state == "running":
+            timing = f"running for {int(time.time() - self.started_at)}s"
+        else:
+            timing = f"{self.state} in {int(self.finished_at - self.started_at)}s"
+        detail = f" ({self.error or self.progress})" if self.error or self.progress else ""
+        return f"#{self.id} {self.name} in {channel_name}: {timing}{detail}"
+
+
+# Runs long commands on a worker pool. Jobs for the same channel run one after another in submission
+# order, jobs for different channels run in parallel. notify(channel_id, text) reports the outcome,
+# unless the job was given its own report(job, text)
+class JobScheduler:
+    def __init__(self, notify: Callable[[str, str], None], workers=job_workers):
+        self.notify = notify
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jobs")
+        self.queues: Dict[str, Deque[Tuple[Job, Callable[[Job], str]]]] = {}
+        self.finished: Deque[Job] = deque(maxlen=finished_kept)
+        self.lock = threading.Lock()
+        self.stopping = False
+
+    # A job that is already waiting with the same name and channel is returned instead of queueing a repeat
+    def submit(self, name, channel_id, work: Callable[[Job], str], report=None) -> Job:
+        with self.lock:
+            queue = self.queues.setdefault(channel_id, deque())
+            for job, _ in queue:
+                if job.name == name and job.state == "queued":
+                    return job
+            job = Job(name, channel_id, report)
+            queue.append((job, work))
+            if len(queue) == 1:
+                self.executor.submit(self.drain, channel_id)
+            return job
+
+    def drain(self, channel_id):
+        while True:
+            with self.lock:
+                job, work = self.queues[channel_id][0]
+            self.run(job, work)
+            with self.lock:
+                queue = self.queues[channel_id]
+                queue.popleft()
+                self.finished.append(job)
+                if not queue or self.stopping:
+                    del self.queues[channel_id]
+                    return
+
+    def run(self, job: Job, work: Callable[[Job], str]):
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            message = work(job)
+            job.state = "done"
+        except Exception as e:
+            job.state = "failed"
+            job.error = repr(e)
+            message = f"Sorry, I couldn't finish {job.name}: {e}"
+        job.finished_at = time.time()
+        try:
+            if job.report:
+                job.report(job, message)
+            else:
+                self.notify(job.channel_id, message)
+        except Exception as e:
+            print(f"Failed to report job #{job.id} to {job.channel_id}: {e!r}")
+
+    # Jobs that haven't started are dropped and running ones are not waited for, the interpreter
+    # still joins the workers on exit
+    def shutdown(self):
+        with self.lock:
+            self.stopping = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def active(self) -> List[Job]:
+        with self.lock:
+            return [job for queue in self.queues.values() for job, _ in queue]
+
+    def recent(self) -> List[Job]:
+        with self.lock:
+            return list(self.finished)
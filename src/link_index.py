@@ -0,0 +1,91 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Tuple
+from canonical import canonical_url
+
+index_path: str = os.environ.get("NAVI_LINK_INDEX", "link_index.sqlite3")
+search_limit = 10
+# Title matches count for more than url matches when ranking
+title_weight = 5.0
+url_weight = 1.0
+schema = """
+CREATE TABLE IF NOT EXISTS links (id INTEGER PRIMARY KEY, channel TEXT NOT NULL, canonical TEXT NOT NULL,
+    url TEXT NOT NULL, title TEXT, creator TEXT, ts TEXT, section TEXT, posts INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (channel, canonical));
+CREATE VIRTUAL TABLE IF NOT EXISTS link_text USING fts5(title, url, content='links', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS links_inserted AFTER INSERT ON links BEGIN
+    INSERT INTO link_text (rowid, title, url) VALUES (new.id, new.title, new.url);
+END;
+CREATE TRIGGER IF NOT EXISTS links_deleted AFTER DELETE ON links BEGIN
+    INSERT INTO link_text (link_text, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+END;
+CREATE TRIGGER IF NOT EXISTS links_updated AFTER UPDATE ON links BEGIN
+    INSERT INTO link_text (link_text, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+    INSERT INTO link_text (rowid, title, url) VALUES (new.id, new.title, new.url);
+END;
+"""
+# Unchanged rows are left alone so the full-text index isn't rewritten for nothing
+upsert = """
+INSERT INTO links (channel, canonical, url, title, creator, ts, section, posts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (channel, canonical) DO UPDATE SET url = excluded.url, title = excluded.title,
+    creator = excluded.creator, ts = excluded.ts, section = excluded.section, posts = excluded.posts
+WHERE (url, title, creator, ts, section, posts) IS NOT
+    (excluded.url, excluded.title, excluded.creator, excluded.ts, excluded.section, excluded.posts)
+"""
+word = re.compile(r"\w+")
+
+
+# Turns free text into an FTS5 query: every word has to match, as a whole word or a prefix
+def match_query(terms) -> str:
+    return " ".join(f'"{term}"*' for term in word.findall(terms.lower()))
+
+
+# Every link of every channel on disk, one row per canonical url per channel, with a full-text
+# index over titles and urls. Entries are (link, section, title)
+class LinkIndex:
+    def __init__(self, path=index_path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(schema)
+        self.connection.commit()
+
+    @staticmethod
+    def row(channel_id, entry):
+        link, section, title = entry
+        return channel_id, canonical_url(link.url), link.url, title, link.creator, link.timestamp, section, link.posts
+
+    def put(self, channel_id, entries: Iterable[Tuple]):
+        with self.lock:
+            self.connection.executemany(upsert, [self.row(channel_id, entry) for entry in entries])
+            self.connection.commit()
+
+    def has_channel(self, channel_id) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM links WHERE channel = ? LIMIT 1", (channel_id,)).fetchone() \
+                is not None
+
+    # The channel's rows become exactly these entries
+    def replace_channel(self, channel_id, entries: Iterable[Tuple]):
+        rows = [self.row(channel_id, entry) for entry in entries]
+        keep = {row[1] for row in rows}
+        with self.lock:
+            stale = [(channel_id, canonical) for canonical, in
+                     self.connection.execute("SELECT canonical FROM links WHERE channel = ?", (channel_id,))
+                     if canonical not in keep]
+            self.connection.executemany("DELETE FROM links WHERE channel = ? AND canonical = ?", stale)
+            self.connection.executemany(upsert, rows)
+            self.connection.commit()
+
+    # Best matches first: (channel, url, title, creator, ts, section, posts)
+    def search(self, terms, limit=search_limit) -> List[Tuple]:
+        query = match_query(terms)
+        if not query:
+            return []
+        with self.lock:
+            return self.connection.execute(
+                "SELECT links.channel, links.url, links.title, links.creator, links.ts, links.section, links.posts "
+                "FROM link_text JOIN links ON links.id = link_text.rowid WHERE link_text MATCH ? "
+                "ORDER BY bm25(link_text, ?, ?), CAST(links.ts AS REAL) DESC LIMIT ?",
+                (query, title_weight, url_weight, limit)).fetchall()
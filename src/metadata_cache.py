@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+cache_path: str = os.environ.get("NAVI_METADATA_CACHE", "metadata_cache.sqlite3")
+max_entries: int = int(os.environ.get("NAVI_METADATA_CACHE_SIZE", 50000))
+# Seconds an entry stays fresh, by fetch status. "ignored" is the negative cache for pages whose
+# title matched ignored_titles, "skipped" is for non-html bodies, "error" covers timeouts and missing titles
+ttls: Dict[str, int] = {"ok": int(os.environ.get("NAVI_METADATA_TTL", 30 * 24 * 3600)),
+                        "skipped": int(os.environ.get("NAVI_METADATA_TTL", 30 * 24 * 3600)),
+                        "ignored": int(os.environ.get("NAVI_METADATA_NEGATIVE_TTL", 7 * 24 * 3600)),
+                        "error": int(os.environ.get("NAVI_METADATA_ERROR_TTL", 24 * 3600))}
+
+
+class CachedTitle:
+    def __init__(self, url, title, status, fetched_at):
+        self.url = url
+        self.title = title
+        self.status = status
+        self.fetched_at = fetched_at
+
+    def expired(self, now=None):
+        return (now or time.time()) - self.fetched_at > ttls.get(self.status, 0)
+
+
+# Disk backed url -> title store with per-status TTLs and least-recently-used eviction past max_entries
+class MetadataCache:
+    def __init__(self, path=cache_path, size=max_entries):
+        self.size = size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS titles (url TEXT PRIMARY KEY, title TEXT NOT NULL, "
+                                "status TEXT NOT NULL, fetched_at REAL NOT NULL, last_used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS titles_last_used ON titles (last_used)")
+        self.connection.commit()
+
+    def get(self, url) -> Optional[CachedTitle]:
+        return self.get_many([url]).get(url)
+
+    # Fresh entries only; hits get their last_used bumped so eviction keeps them around
+    def get_many(self, urls: Iterable[str]) -> Dict[str, CachedTitle]:
+        urls = list(dict.fromkeys(urls))
+        now = time.time()
+        found = {}
+        with self.lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT url, title, status, fetched_at FROM titles WHERE url IN ({','.join('?' * len(chunk))})",
+                    chunk)
+                for row in rows:
+                    entry = CachedTitle(*row)
+                    if not entry.expired(now):
+                        found[entry.url] = entry
+            self.connection.executemany("UPDATE titles SET last_used = ? WHERE url = ?",
+                                        [(now, url) for url in found])
+            self.connection.commit()
+        return found
+
+    def put(self, url, title, status):
+        self.put_many([(url, title, status)])
+
+    def put_many(self, entries: Iterable[Tuple[str, str, str]]):
+        now = time.time()
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO titles VALUES (?, ?, ?, ?, ?)",
+                                        [(url, title, status, now, now) for url, title, status in entries])
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        overflow = self.connection.execute("SELECT COUNT(*) FROM titles").fetchone()[0] - self.size
+        if overflow > 0:
+            self.connection.execute("DELETE FROM titles WHERE url IN "
+                                    "(SELECT url FROM titles ORDER BY last_used LIMIT ?)", (overflow,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Requests per minute for each of Slack's Web API rate tiers
+slack_tiers = {1: 1, 2: 20, 3: 50, 4: 100}
+slack_method_tiers = {
+    "conversations.history": 3,
+    "conversations.list": 2,
+    "conversations.info": 3,
+    "channels.info": 3,
+    "groups.info": 3,
+    "users.list": 2,
+    "users.info": 4,
+    "rtm.connect": 1,
+}
+# chat.postMessage is limited to about one message per second per channel instead of by tier
+post_message_per_minute = 60
+# GitHub allows 5000 authenticated requests an hour, and its secondary limits cap requests that
+# create content (every gist POST/PATCH/PUT/DELETE) at 80 a minute and 500 an hour
+github_per_hour = 5000
+github_writes_per_minute = 80
+github_writes_per_hour = 500
+# Once fewer than this many core requests are left in GitHub's window, spread the rest evenly until it resets
+github_low_water = 500
+slack_max_attempts = 5
+
+
+class TokenBucket:
+    def __init__(self, per_second, capacity):
+        self.per_second = per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    # Blocks until a token is free, returns how long the caller waited
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self.lock:
+                self.refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.per_second
+            time.sleep(delay)
+            waited += delay
+
+
+def per_minute(count):
+    # a burst of up to a tenth of the minute's allowance, then a steady drip
+    return TokenBucket(count / 60, max(1, count // 10))
+
+
+def per_hour(count):
+    # ten minutes' worth can go at once, the per-minute buckets keep those bursts in check
+    return TokenBucket(count / 3600, max(1, count // 6))
+
+
+# Every outbound Slack api_call and gist request passes through here. Token buckets pace callers
+# ahead of the documented limits, responses feed back Retry-After and GitHub's X-RateLimit-* headers,
+# and a throttle pauses everyone calling the same API until it lifts. throttles counts the 429s
+# (and rate limited 403s) seen per service
+class Governor:
+    def __init__(self):
+        self.slack_buckets: Dict[str, TokenBucket] = {}
+        self.post_buckets: Dict[str, TokenBucket] = {}
+        self.github = per_hour(github_per_hour)
+        self.github_writes: List[TokenBucket] = [per_minute(github_writes_per_minute),
+                                                 per_hour(github_writes_per_hour)]
+        self.paused_until: Dict[str, float] = {}
+        self.github_remaining: Optional[int] = None
+        self.github_reset: Optional[float] = None
+        self.throttles = Counter()
+        self.lock = threading.Lock()
+
+    def bucket(self, buckets, key, make) -> TokenBucket:
+        with self.lock:
+            if key not in buckets:
+                buckets[key] = make()
+            return buckets[key]
+
+    def pause(self, key, seconds):
+        with self.lock:
+            self.paused_until[key] = max(self.paused_until.get(key, 0), time.time() + seconds)
+
+    def wait_for(self, key) -> float:
+        delay = max(0.0, self.paused_until.get(key, 0) - time.time())
+        time.sleep(delay)
+        return delay
+
+    def slack(self, method, channel=None) -> float:
+        waited = self.wait_for("slack:" + method)
+        if method == "chat.postMessage":
+            return waited + self.bucket(self.post_buckets, channel,
+                                        lambda: per_minute(post_message_per_minute)).acquire()
+        tier = slack_method_tiers.get(method, 3)
+        return waited + self.bucket(self.slack_buckets, method, lambda: per_minute(slack_tiers[tier])).acquire()
+
+    # Seconds to back off if Slack rate limited this call, otherwise None
+    def observe_slack(self, method, response) -> Optional[float]:
+        if response.get('error') != 'ratelimited':
+            return None
+        retry_after = int(response.get('headers', {}).get('Retry-After', 1))
+        self.throttles['slack'] += 1
+        self.pause("slack:" + method, retry_after)
+        return retry_after
+
+    def gist(self, http_method) -> float:
+        waited = self.wait_for("github")
+        with self.lock:
+            remaining, reset = self.github_remaining, self.github_reset
+        if remaining is not None and reset is not None and remaining < github_low_water:
+            delay = max(0.0, reset - time.time()) / max(1, remaining)
+            time.sleep(delay)
+            waited += delay
+        waited += self.github.acquire()
+        if http_method.upper() != 'GET':
+            waited += sum(bucket.acquire() for bucket in self.github_writes)
+        return waited
+
+    # requests response hook for the gist session
+    def observe_github(self, response, *args, **kwargs):
+        headers = response.headers
+        if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+            with self.lock:
+                self.github_remaining = int(headers['X-RateLimit-Remaining'])
+                self.github_reset = float(headers['X-RateLimit-Reset'])
+        limited = response.status_code == 429 or (
+            response.status_code == 403 and ('Retry-After' in headers or headers.get('X-RateLimit-Remaining') == '0'))
+        if limited:
+            self.throttles['github'] += 1
+            if 'Retry-After' in headers:
+                self.pause("github", int(headers['Retry-After']))
+            elif 'X-RateLimit-Reset' in headers:
+                self.pause("github", float(headers['X-RateLimit-Reset']) - time.time())
+
+
+# Drop-in wrapper for a SlackClient that sends every api_call through the governor and retries
+# calls Slack rate limited. Everything else (rtm_connect, rtm_read, server...) passes straight through
+class GovernedSlackClient:
+    def __init__(self, slack_client, governor):
+        self.slack_client = slack_client
+        self.governor = governor
+        self.local = threading.local()
+
+    def api_call(self, method, **kwargs):
+        self.local.throttled = False
+        for attempt in range(slack_max_attempts):
+            self.governor.slack(method, kwargs.get('channel'))
+            response = self.slack_client.api_call(method, **kwargs)
+            if self.governor.observe_slack(method, response) is None:
+                break
+            self.local.throttled = True
+        return response
+
+    # Whether the last api_call made on this thread was rate limited along the way
+    @property
+    def throttled(self):
+        return getattr(self.local, 'throttled', False)
+
+    def __getattr__(self, name):
+        return getattr(self.slack_client, name)
+
+
+governor = Governor()
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Optional JSON file of section rules: {"default": [rules], "channels": {channel_id: [rules]}}.
+# A rule is {"section": title, "text": text}, matching text anywhere in the url as written,
+# {"section": title, "host": domain} or {"section": title, "path": text}, the path and query in any
+# case. Channel rules come before the default ones, and among all of them the first rule that
+# matches a url wins
+sections_path: str = os.environ.get("NAVI_SECTIONS", "")
+fallback_section = "Misc"
+# The keywords links have always been filed by, in the order they were tried
+default_rules: List[Dict[str, str]] = [
+    {"section": "GitHub", "text": "git"},
+    {"section": "StackOverflow", "text": "stackoverflow"},
+    {"section": "Java", "text": "java"},
+    {"section": "Python", "text": "python"},
+    {"section": "Interview", "text": "interview"},
+]
+# scheme, optional userinfo, then the host and whatever follows the authority. Only needed for the
+# odd url whose query or fragment comes straight after the host, the rest are split on "/"
+authority = re.compile(r"[a-z][a-z0-9+.-]*://(?:[^/?#@]*@)?([^/?#:]*)[^/?#]*(.*)", re.I | re.S)
+
+
+def split_url(url) -> Tuple[str, str]:
+    parts = url.split('/', 3)
+    if len(parts) < 3 or parts[1] or not parts[0].endswith(':') or '?' in parts[2] or '#' in parts[2]:
+        match = authority.match(url)
+        return (match.group(1), match.group(2)) if match else ("", "")
+    return parts[2].rpartition('@')[2].partition(':')[0], parts[3] if len(parts) > 3 else ""
+
+
+# Rules sorted by kind: text rules into a priority-ordered list of substrings checked against the url
+# as it is, host rules into a table of domain suffixes, each keeping the priority of its best rule, and
+# path rules into a priority-ordered list. The url is only split when a host or path rule could
+# still beat the best text match
+class SectionClassifier:
+    def __init__(self, rules: List[Dict[str, str]]):
+        self.rules = rules
+        self.sections: List[str] = list(dict.fromkeys([rule['section'] for rule in rules] + [fallback_section]))
+        self.texts: List[Tuple[int, str]] = []
+        self.hosts: Dict[str, int] = {}
+        self.paths: List[Tuple[int, str]] = []
+        for priority, rule in enumerate(rules):
+            if 'text' in rule:
+                self.texts.append((priority, rule['text']))
+            elif 'host' in rule:
+                self.hosts.setdefault(rule['host'].lower(), priority)
+            elif 'path' in rule:
+                self.paths.append((priority, rule['path'].lower()))
+            else:
+                raise ValueError(f"Section rule needs a text, a host or a path: {rule}")
+        # one C-level check lets urls on hosts without any rule skip the suffix walk
+        self.host_suffixes = tuple(self.hosts)
+        self.first_split = min([min(self.hosts.values(), default=len(rules))] +
+                               [priority for priority, _ in self.paths[:1]])
+
+    def classify(self, url) -> str:
+        best = len(self.rules)
+        for priority, text in self.texts:
+            if text in url:
+                best = priority
+                break
+        if self.first_split < best:
+            best = self.match_split(url, best)
+        return self.rules[best]['section'] if best < len(self.rules) else fallback_section
+
+    def match_split(self, url, best) -> int:
+        host, rest = split_url(url)
+        host = host.lower()
+        # the host itself, then every parent domain: docs.python.org, python.org, org
+        while host.endswith(self.host_suffixes):
+            best = min(best, self.hosts.get(host, best))
+            dot = host.find('.')
+            host = host[dot + 1:] if dot >= 0 else ""
+        rest = rest.lower() if self.paths and self.paths[0][0] < best else ""
+        for priority, text in self.paths:
+            if priority >= best:
+                break
+            if text in rest:
+                best = priority
+                break
+        return best
+
+
+# One classifier per channel, compiled on first use. reload re-reads the rules file so a channel
+# can be given new rules while the bot keeps running
+class Classifiers:
+    def __init__(self, path=sections_path):
+        self.path = path
+        self.config = self.read()
+        self.classifiers: Dict[Optional[str], SectionClassifier] = {}
+        self.lock = threading.Lock()
+
+    def read(self):
+        if not self.path:
+            return {}
+        with open(self.path) as file:
+            return json.load(file)
+
+    def get(self, channel_id=None) -> SectionClassifier:
+        with self.lock:
+            if channel_id not in self.classifiers:
+                rules = self.config.get('channels', {}).get(channel_id, []) + \
+                        self.config.get('default', default_rules)
+                self.classifiers[channel_id] = SectionClassifier(rules)
+            return self.classifiers[channel_id]
+
+    def reload(self, channel_id=None) -> SectionClassifier:
+        config = self.read()
+        with self.lock:
+            self.config = config
+            if channel_id is None:
+                self.classifiers.clear()
+            else:
+                self.classifiers.pop(channel_id, None)
+        return self.get(channel_id)
+
+
+classifiers = Classifiers()
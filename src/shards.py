@@ -0,0 +1,72 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Start a new shard every calendar month ("month"), or once the newest shard holds this many links
+shard_by: str = os.environ.get("NAVI_SHARD_BY", "month")
+
+
+def month_key(timestamp) -> str:
+    return datetime.utcfromtimestamp(float(timestamp)).strftime('%Y-%m')
+
+
+# Lists a channel's shards, oldest first, and decides when the next one starts. It is kept in the
+# channel's main json file, <base>.json, with each shard's links in <base>.<key>.json and its md page
+# in <base>.<key>.md. Only the newest shard ever takes new links, including the odd older message
+# that turns up late, so updates never rewrite older shards. They still sit in the same gist, which
+# GitHub returns whole on every read and write
+class Manifest:
+    def __init__(self, base, by=shard_by, shards: Optional[List[Dict]] = None):
+        if by != "month" and not str(by).isdigit():
+            raise ValueError(f"Shards are made by month or by a link count, not {by!r}")
+        self.base = base
+        self.by = str(by)
+        self.shards: List[Dict] = shards or []
+
+    def to_json(self):
+        return {'by': self.by, 'shards': self.shards}
+
+    @classmethod
+    def from_json(cls, base, data):
+        return cls(base, data['by'], data['shards'])
+
+    # The main json file of channels stored before sharding holds the sections themselves
+    @staticmethod
+    def is_manifest(data) -> bool:
+        return 'shards' in data and 'by' in data
+
+    def json_name(self, key) -> str:
+        return f"{self.base}.{key}.json"
+
+    def md_name(self, key) -> str:
+        return f"{self.base}.{key}.md"
+
+    @property
+    def newest(self) -> Optional[Dict]:
+        return self.shards[-1] if self.shards else None
+
+    def first_key(self, timestamp) -> str:
+        return month_key(timestamp) if self.by == "month" else "0001"
+
+    # Key of the shard a link arriving now should start, or None when it belongs in the newest one
+    def next_key(self, timestamp) -> Optional[str]:
+        if not self.shards:
+            return self.first_key(timestamp)
+        newest = self.newest
+        if self.by == "month":
+            key = month_key(timestamp)
+            return key if key > newest['key'] else None
+        return f"{int(newest['key']) + 1:04d}" if newest['links'] >= int(self.by) else None
+
+    def start(self, key):
+        self.shards.append({'key': key, 'links': 0})
+
+    # Deals a whole history out into shards, oldest first, each link by the time of its first post
+    def split(self, links: List) -> List[Tuple[str, List]]:
+        shards: Dict[str, List] = {}
+        size = int(self.by) if self.by != "month" else 0
+        for position, link in enumerate(sorted(links, key=lambda x: float(x.timestamp))):
+            key = month_key(link.timestamp) if not size else f"{position // size + 1:04d}"
+            shards.setdefault(key, []).append(link)
+        self.shards = [{'key': key, 'links': len(shard)} for key, shard in shards.items()]
+        return list(shards.items())
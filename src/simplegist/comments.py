@@ -1,5 +1,4 @@
 import json
-import requests
 from simplegist.config import BASE_URL, GIST_URL
 
 class Comments:
@@ -12,7 +11,7 @@ class Comments:
 		Getting gistID of a gist in order to make the workflow
 		easy and uninterrupted.
 		'''
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s'%BASE_URL+'/users/%s/gists' % self.user,
 			headers=self.gist.header
 			)
@@ -47,7 +46,7 @@ class Comments:
 
 		if self.gist_id:
 			allcomments = []
-			r = requests.get(
+			r = self.gist.session.get(
 				'%s'%BASE_URL+'/gists/%s/comments' % self.gist_id,
 				headers=self.gist.header
 			)
@@ -83,7 +82,7 @@ class Comments:
 
 		if self.gist_id:
 
-			r = requests.post(
+			r = self.gist.session.post(
 				'%s'%BASE_URL+'/gists/%s/comments' % self.gist_id,
 				headers=self.gist.header,
 				data=json.dumps(self.body)
@@ -120,7 +119,7 @@ class Comments:
 			raise Exception('CommenID not provided')
 
 		if self.gist_id:
-			r = requests.delete(
+			r = self.gist.session.delete(
 				'%s/gists/%s/comments/%s'%(BASE_URL,self.gist_id, self.commentid),
 				headers=self.gist.header
 			)
@@ -159,7 +158,7 @@ class Comments:
 			raise Exception('CommenID not provided')
 
 		if self.gist_id:
-			r = requests.get(
+			r = self.gist.session.get(
 				'%s/gists/%s/comments/%s'%(BASE_URL,self.gist_id, self.commentid),
 				headers=self.gist.header
 			)
@@ -207,7 +206,7 @@ class Comments:
 
 		if self.gist_id:
 
-			r = requests.patch(
+			r = self.gist.session.patch(
 				'%s/gists/%s/comments/%s'%(BASE_URL,self.gist_id, self.commentid),
 				headers=self.gist.header,
 				data=json.dumps(self.body)
@@ -14,4 +14,15 @@ API_TOKEN = ''
 LIMIT = None
 
 BASE_URL = 'https://api.github.com'
-GIST_URL = 'https://gist.github.com'
\ No newline at end of file
+GIST_URL = 'https://gist.github.com'
+
+# Connection pool size, request timeout in seconds (connect, read),
+# and retry policy for 5xx/rate limited responses
+POOL_SIZE = 10
+TIMEOUT = (3.05, 30)
+RETRIES = 5
+BACKOFF = 0.5
+
+# Seconds a fetched gist is served from memory before it is revalidated
+# with a conditional request
+CACHE_MAX_AGE = 30
@@ -1,5 +1,4 @@
 import json
-import requests
 from simplegist.config import BASE_URL, GIST_URL
 
 class Do:
@@ -11,7 +10,7 @@ class Do:
 		Getting gistID of a gist in order to make the workflow
 		easy and uninterrupted.
 		'''
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s'%BASE_URL+'/users/%s/gists' % self.gist.username,
 			headers=self.gist.header
 			)
@@ -37,7 +36,7 @@ class Do:
 		else:
 			raise Exception('Either provide authenticated user\'s Unambigious Gistname or any unique Gistid to be starred')
 
-		r = requests.put(
+		r = self.gist.session.put(
 			'%s'%BASE_URL+'/gists/%s/star' % self.gist_id,
 			headers=self.gist.header
 			)
@@ -61,7 +60,7 @@ class Do:
 		else:
 			raise Exception('Either provide authenticated user\'s Unambigious Gistname or any unique Gistid to be unstarred')
 
-		r = requests.delete(
+		r = self.gist.session.delete(
 			'%s'%BASE_URL+'/gists/%s/star' % self.gist_id,
 			headers=self.gist.header
 			)
@@ -85,7 +84,7 @@ class Do:
 		else:
 			raise Exception('Either provide authenticated user\'s Unambigious Gistname or any unique Gistid to be forked')
 
-		r = requests.post(
+		r = self.gist.session.post(
 			'%s'%BASE_URL+'/gists/%s/forks' % self.gist_id,
 			headers=self.gist.header
 			)
@@ -113,7 +112,7 @@ class Do:
 		else:
 			raise Exception('Either provide authenticated user\'s Unambigious Gistname or any unique Gistid to be checked for star')
 
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s'%BASE_URL+'/gists/%s/star' % self.gist_id,
 			headers=self.gist.header
 			)
@@ -1,6 +1,6 @@
 import json
-import requests
-from simplegist.config import BASE_URL, GIST_URL
+import time
+from simplegist.config import BASE_URL, GIST_URL, CACHE_MAX_AGE
 
 class Mygist:
 	def __init__(self, gist, **args):
@@ -19,7 +19,7 @@ class Mygist:
 		    print a[0] #to fetch first gistName
 		'''
 		file_name = []
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s/users/%s/gists' % (BASE_URL, self.user),
 			headers=self.gist.header
 			)
@@ -42,7 +42,7 @@ class Mygist:
 		    print a[0] #to fetch first gistName
 		'''
 		file_name = []
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s/users/%s/gists' %(BASE_URL,self.user),
 			headers=self.gist.header
 			)
@@ -61,7 +61,7 @@ class Mygist:
 		Getting gistID of a gist in order to make the workflow
 		easy and uninterrupted.
 		'''
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s'%BASE_URL+'/users/%s/gists' % self.user,
 			headers=self.gist.header
 			)
@@ -93,21 +93,94 @@ class Mygist:
 
 
 		if self.gist_id:
-			r = requests.get(
-				'%s'%BASE_URL+'/gists/%s' %self.gist_id,
-				headers=self.gist.header
-				)
-			if (r.status_code == 200):
-				r_text = json.loads(r.text)
+			gist = self.fetch(self.gist_id)
+			if gist is not None:
 				if self.gist_name!='':
-					content =  r.json()['files'][self.gist_name]['content']
+					content = self.file_content(gist['files'][self.gist_name])
 				else:
-					for key,value in r.json()['files'].items():
-						content = r.json()['files'][value['filename']]['content']
+					for key,value in gist['files'].items():
+						content = self.file_content(value)
 				return content
 
 		raise Exception('No such gist found')
 
+	def fetch(self, gist_id):
+		'''
+		GET a gist as parsed json, or None if it can't be found.
+		Copies fetched in the last CACHE_MAX_AGE seconds are served from
+		memory, older ones are revalidated with If-None-Match /
+		If-Modified-Since and reused when GitHub answers 304
+		'''
+		cached = self.gist.cache.get(gist_id)
+		if cached and time.time() - cached['checked'] < CACHE_MAX_AGE:
+			return cached['body']
+
+		headers = dict(self.gist.header)
+		if cached and cached['etag']:
+			headers['If-None-Match'] = cached['etag']
+		if cached and cached['last_modified']:
+			headers['If-Modified-Since'] = cached['last_modified']
+
+		r = self.gist.session.get(
+			'%s/gists/%s'%(BASE_URL,gist_id),
+			headers=headers
+			)
+		if (r.status_code == 304 and cached):
+			cached['checked'] = time.time()
+			return cached['body']
+		if (r.status_code == 200):
+			return self.remember(gist_id, r)
+		return None
+
+	def remember(self, gist_id, r):
+		'''
+		Cache a gist body from a GET or PATCH response with its validators
+		'''
+		body = r.json()
+		self.gist.cache[gist_id] = {
+			'body': body,
+			'etag': r.headers.get('ETag'),
+			'last_modified': r.headers.get('Last-Modified'),
+			'checked': time.time()
+		}
+		return body
+
+	def file_content(self, value):
+		'''
+		Content of one file of a fetched gist. GitHub cuts a file's content
+		off at 1MB in the gist json and sets truncated, the whole file is
+		then read from its raw_url (up to 10MB, past that only a git clone
+		has it). The cached gist keeps the full content, raw_url names the
+		file at this revision
+		'''
+		if value.get('truncated'):
+			r = self.gist.session.get(value['raw_url'], headers=self.gist.header)
+			if (r.status_code != 200):
+				raise Exception('Can not read truncated file %s' % value['filename'])
+			value['content'] = r.text
+			value['truncated'] = False
+		return value['content']
+
+	def files(self, **args):
+		'''
+		Return every file of a gist as a filename -> content dict,
+		for gists that keep more than one file. Pass names=[...] to
+		only read those files
+		'''
+		if 'id' in args:
+			self.gist_id = args['id']
+		else:
+			raise Exception('Gist ID must be provided')
+
+		if self.gist_id:
+			gist = self.fetch(self.gist_id)
+			if gist is not None:
+				names = args.get('names')
+				return {key: self.file_content(value) for key,value in gist['files'].items()
+					if names is None or key in names}
+
+		raise Exception('No such gist found')
+
 	def getgist(self, **args):
 
 		if 'id' in args:
@@ -116,13 +189,10 @@ class Mygist:
 			raise Exception('Gist ID must be provided')
 
 		if self.gist_id:
-			r = requests.get(
-				'%s/gists/%s'%(BASE_URL,self.gist_id),
-				headers=self.gist.header,
-				)
-			if (r.status_code == 200):
+			gist = self.fetch(self.gist_id)
+			if gist is not None:
 
-				for key,value in r.json()['files'].items():
+				for key,value in gist['files'].items():
 						content = value['filename']
 				return content
 
@@ -132,7 +202,9 @@ class Mygist:
 	def edit(self, **args):
 		'''
 		Doesn't require manual fetching of gistID of a gist
-		passing gistName will return edit the gist
+		passing gistName will return edit the gist.
+		Pass files={filename: content} with the gistID to update several
+		files in one request, no filename lookup needed
 		'''
 		self.gist_name = ''
 		if 'description' in args:
@@ -152,12 +224,18 @@ class Mygist:
 		else:
 			raise Exception('Gist Name/ID must be provided')
 
-		if 'content' in args:
+		if 'files' in args:
+			self.content = args['files']
+		elif 'content' in args:
 			self.content = args['content']
 		else:
 			raise Exception('Gist content can\'t be empty')
 
-		if (self.gist_name == ''):
+		if 'files' in args:
+			data = {"description": self.description,
+				"files": dict((name, {"content": content}) for name, content in self.content.items())
+			}
+		elif (self.gist_name == ''):
 			self.gist_name = self.getgist(id=self.gist_id)
 			data = {"description": self.description,
   				"files": {
@@ -177,17 +255,19 @@ class Mygist:
 
 
 		if self.gist_id:
-			r = requests.patch(
+			r = self.gist.session.patch(
 				'%s/gists/%s'%(BASE_URL,self.gist_id),
 				headers=self.gist.header,
 				data=json.dumps(data),
 				)
 			if (r.status_code == 200):
-				r_text = json.loads(r.text)
+				# the PATCH response is the updated gist with every file in it, parsed once and
+				# cached, truncated files are read from their raw_url when asked for
+				body = self.remember(self.gist_id, r)
 				response = {
 					'updated_content': self.content,
-					'created_at': r.json()['created_at'],
-					'comments':r.json()['comments']
+					'created_at': body['created_at'],
+					'comments': body['comments']
 				}
 
 				return response
@@ -210,11 +290,12 @@ class Mygist:
 
 		url = 'gists'
 		if self.gist_id:
-			r = requests.delete(
+			r = self.gist.session.delete(
 				'%s/%s/%s'%(BASE_URL,url,self.gist_id),
 				headers=self.gist.header
 				)
 			if (r.status_code == 204):
+				self.gist.cache.pop(self.gist_id, None)
 				response = {
 					'id': self.gist_id,
 				}
@@ -228,7 +309,7 @@ class Mygist:
 		List the authenticated user's starred gists
 		'''
 		ids =[]
-		r = requests.get(
+		r = self.gist.session.get(
 			'%s/gists/starred'%BASE_URL,
 			headers=self.gist.header
 			)
@@ -257,7 +338,7 @@ class Mygist:
 		else:
 			raise Exception('Gist Name/ID must be provided')
 		if self.gist_id:
-			r = requests.get(
+			r = self.gist.session.get(
 				'%s/gists/%s'%(BASE_URL,self.gist_id),
 				headers=self.gist.header,
 				)
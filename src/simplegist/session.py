@@ -0,0 +1,47 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from simplegist.config import POOL_SIZE, TIMEOUT, RETRIES, BACKOFF
+
+class GistRetry(Retry):
+	'''
+	Retry 5xx and 429 responses with backoff, plus the 403s GitHub
+	sends for secondary rate limits (those always carry Retry-After)
+	'''
+	def is_retry(self, method, status_code, has_retry_after=False):
+		if status_code == 403:
+			return has_retry_after and super(GistRetry, self).is_retry(method, 429, has_retry_after)
+		return super(GistRetry, self).is_retry(method, status_code, has_retry_after)
+
+
+class GistSession(requests.Session):
+	'''
+	Keep-alive session shared by every request a Simplegist instance
+	makes, with a connection pool, retries and a default timeout.
+	rate_limit, when given, is called with the HTTP method before each
+	request and may block to keep us under GitHub's limits. on_response
+	is installed as a requests response hook, to watch rate limit headers
+	'''
+	def __init__(self, timeout=TIMEOUT, rate_limit=None, on_response=None):
+		super(GistSession, self).__init__()
+		self.timeout = timeout
+		self.rate_limit = rate_limit
+		if on_response:
+			self.hooks['response'].append(on_response)
+		retry = GistRetry(
+			total=RETRIES,
+			backoff_factor=BACKOFF,
+			status_forcelist=[403, 429, 500, 502, 503, 504],
+			# creating a gist twice is worse than failing once
+			allowed_methods=frozenset(['GET', 'PUT', 'PATCH', 'DELETE']),
+			raise_on_status=False
+			)
+		adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+		self.mount('https://', adapter)
+		self.mount('http://', adapter)
+
+	def request(self, method, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		if self.rate_limit:
+			self.rate_limit(method)
+		return super(GistSession, self).request(method, url, **kwargs)
@@ -1,9 +1,9 @@
-import requests
 import json
 from simplegist.config import USERNAME, API_TOKEN, BASE_URL, GIST_URL
 from simplegist.mygist import Mygist
 from simplegist.do import Do
 from simplegist.comments import Comments
+from simplegist.session import GistSession
 
 class Simplegist:
 	"""
@@ -40,6 +40,11 @@ class Simplegist:
 						'Authorization': 'token %s' %self.api_token
 					  }
 
+		# One keep-alive session for this instance and every subclient it hands out
+		self.session = GistSession(rate_limit=args.get('rate_limit'), on_response=args.get('on_response'))
+		# gist id -> last seen body and validators, see Mygist.fetch
+		self.cache = {}
+
 	def profile(self):
 		return Mygist(self)
 
@@ -68,14 +73,23 @@ class Simplegist:
 		else:
 			self.public = True
 
-		if 'content' in args:
+		# files={filename: content} creates a gist holding several files
+		if 'files' in args:
+			self.content = args['files']
+		elif 'content' in args:
 			self.content = args['content']
 		else:
 			raise Exception('Gist content can\'t be empty')
 
 		url = '/gists'
 
-		data = {"description": self.description,
+		if 'files' in args:
+			data = {"description": self.description,
+				"public": self.public,
+				"files": dict((name, {"content": content}) for name, content in self.content.items())
+			}
+		else:
+			data = {"description": self.description,
   				"public": self.public,
   				"files": {
     				self.gist_name: {
@@ -84,7 +98,7 @@ class Simplegist:
   				}
   		}
 
-		r = requests.post(
+		r = self.session.post(
 			'%s%s' % (BASE_URL, url),
 			data=json.dumps(data),
 			headers=self.header
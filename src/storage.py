@@ -0,0 +1,81 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+# "gist" keeps every document on GitHub, "git" in the local bare repo (see git_storage)
+storage_backend: str = os.environ.get("NAVI_STORAGE", "gist")
+# With the git backend, also push every commit's documents to their gists in the background. Required
+# by the bot, whose links all point at the gists
+mirror_to_gists: bool = os.environ.get("NAVI_GIT_MIRROR", "") == "1"
+# GitHub anchors each file of a gist at #file-<name, lowercase, anything else as dashes>
+file_anchor = re.compile(r"[^a-z0-9]")
+
+
+# Where history keeps its documents. A document is a few named text files under one id: a gist,
+# or a directory of the local git store. Backends may write behind, flush makes everything durable
+class Storage(ABC):
+    # Only the named files when names are given, backends that can read files one by one do
+    @abstractmethod
+    def load(self, doc_id, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        pass
+
+    def names(self, doc_id) -> List[str]:
+        return list(self.load(doc_id))
+
+    # Replaces the given files of the document, leaving its other files alone
+    @abstractmethod
+    def save(self, doc_id, files: Dict[str, str]):
+        pass
+
+    # Returns the new document's id
+    @abstractmethod
+    def create(self, files: Dict[str, str], description) -> str:
+        pass
+
+    # Where people in Slack can read the document
+    @abstractmethod
+    def url(self, doc_id) -> str:
+        pass
+
+    # Where people in Slack can read one file of the document
+    @abstractmethod
+    def file_url(self, doc_id, name) -> str:
+        pass
+
+    def flush(self):
+        pass
+
+
+class GistStorage(Storage):
+    def __init__(self, gist):
+        self.gist = gist
+
+    # A gist always comes whole (and usually from the ETag cache), names only filters it and spares
+    # reading the other files GitHub truncated
+    def load(self, doc_id, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        return self.gist.profile().files(id=doc_id, names=None if names is None else set(names))
+
+    def save(self, doc_id, files: Dict[str, str]):
+        self.gist.profile().edit(id=doc_id, files=files)
+
+    def create(self, files: Dict[str, str], description) -> str:
+        return self.gist.create(description=description, files=files)['id']
+
+    def url(self, doc_id) -> str:
+        return f"https://gist.github.com/{self.gist.username}/{doc_id}"
+
+    def file_url(self, doc_id, name) -> str:
+        return f"{self.url(doc_id)}#file-{file_anchor.sub('-', name.lower())}"
+
+
+def open_storage(gist) -> Storage:
+    if storage_backend == "gist":
+        return GistStorage(gist)
+    if storage_backend == "git":
+        # the git store's own urls are files on the dyno, the links posted to Slack have to be gists
+        if not mirror_to_gists:
+            raise ValueError("NAVI_STORAGE=git needs NAVI_GIT_MIRROR=1, Slack can only link to the gist mirror")
+        from git_storage import GitStorage
+        return GitStorage(mirror=GistStorage(gist))
+    raise ValueError(f"Unknown NAVI_STORAGE backend: {storage_backend}")
@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, zip_longest
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from metadata_cache import MetadataCache
+
+ignored_titles = ["not found", "forbidden", "denied"]
+max_workers: int = int(os.environ.get("NAVI_TITLE_WORKERS", 16))
+max_per_host: int = int(os.environ.get("NAVI_TITLE_PER_HOST", 4))
+connect_timeout: float = float(os.environ.get("NAVI_TITLE_CONNECT_TIMEOUT", 3.05))
+read_timeout: float = float(os.environ.get("NAVI_TITLE_READ_TIMEOUT", 10))
+# Most pages close their <title> within the first few KB, anything past this is never downloaded
+max_title_bytes: int = int(os.environ.get("NAVI_TITLE_MAX_BYTES", 64 * 1024))
+chunk_size = 8192
+head_end = re.compile(rb"</title\s*>|</head\s*>|<body[\s>]", re.I)
+charset = re.compile(r"charset=[\"']?([\w-]+)", re.I)
+
+
+# Read the body only until the title (or the end of <head>) has gone by, never past limit bytes
+def read_head(response, limit=max_title_bytes) -> bytes:
+    head = bytearray()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        scan_from = max(0, len(head) - 16)
+        head += chunk
+        if len(head) >= limit or head_end.search(head, scan_from):
+            break
+    return bytes(head[:limit])
+
+
+# Parse just the head fragment, letting Beautiful Soup sniff a <meta charset> when the header has none
+def parse_title(head: bytes, encoding=None) -> Optional[str]:
+    title = BeautifulSoup(head, 'lxml', parse_only=SoupStrainer('title'), from_encoding=encoding).title
+    return title.string if title is not None else None
+
+
+def is_html(content_type):
+    return not content_type or 'html' in content_type.lower()
+
+
+def extract_title(response, limit=max_title_bytes) -> Optional[str]:
+    content_type = response.headers.get('Content-Type', '')
+    declared = charset.search(content_type)
+    return parse_title(read_head(response, limit), declared.group(1) if declared else None)
+
+
+# Getting the possible title from the link, falling back to the url itself. The status says why:
+# "ok", "ignored" (matched ignored_titles), "skipped" (not an html page) or "error"
+def fetch_page_title(url, timeout=(connect_timeout, read_timeout)) -> Tuple[str, str]:
+    try:
+        with requests.get(url, timeout=timeout, stream=True) as response:
+            if not is_html(response.headers.get('Content-Type')):
+                return url, "skipped"
+            title = extract_title(response)
+        if any(word in title.lower() for word in ignored_titles):
+            return url, "ignored"
+    except:
+        return url, "error"
+    return re.sub(r"[\n\t]*", "", title).strip(), "ok"
+
+
+# Resolves page titles on a thread pool while capping the requests in flight against any single host.
+# Anything already in the metadata cache is answered without touching the network
+class TitleResolver:
+    def __init__(self, workers=max_workers, per_host=max_per_host, timeout=(connect_timeout, read_timeout),
+                 cache=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="titles")
+        self.cache = cache if cache is not None else MetadataCache()
+        self.per_host = per_host
+        self.timeout = timeout
+        self.host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self.lock = threading.Lock()
+
+    def host_slot(self, url):
+        with self.lock:
+            return self.host_slots[urlsplit(url).netloc.lower()]
+
+    def fetch(self, url) -> Tuple[str, str]:
+        with self.host_slot(url):
+            return fetch_page_title(url, self.timeout)
+
+    def resolve(self, url) -> str:
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached.title
+        title, status = self.fetch(url)
+        self.cache.put(url, title, status)
+        return title
+
+    # Only what the metadata cache already has, nothing is fetched
+    def cached(self, urls: Iterable[str]) -> Dict[str, str]:
+        return {url: entry.title for url, entry in self.cache.get_many(list(urls)).items()}
+
+    def resolve_all(self, urls: Iterable[str]) -> Dict[str, str]:
+        urls = list(urls)
+        titles = {url: entry.title for url, entry in self.cache.get_many(urls).items()}
+        missing = interleave_hosts(url for url in urls if url not in titles)
+        try:
+            futures = {url: self.executor.submit(self.fetch, url) for url in missing}
+            fetched = {url: future.result() for url, future in futures.items()}
+        except RuntimeError:
+            # the pool refuses new work once the interpreter is shutting down, e.g. during a final flush
+            fetched = {url: self.fetch(url) for url in missing}
+        self.cache.put_many((url, title, status) for url, (title, status) in fetched.items())
+        titles.update({url: title for url, (title, status) in fetched.items()})
+        return titles
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+# Round-robin the urls across hosts so one busy host doesn't park every worker on its semaphore
+def interleave_hosts(urls: Iterable[str]) -> List[str]:
+    by_host: Dict[str, List[str]] = defaultdict(list)
+    for url in dict.fromkeys(urls):
+        by_host[urlsplit(url).netloc.lower()].append(url)
+    return [url for url in chain.from_iterable(zip_longest(*by_host.values())) if url is not None]
@@ -0,0 +1,135 @@
+import atexit
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Set
+
+flush_window: float = float(os.environ.get("NAVI_FLUSH_WINDOW", 10))
+flush_max_pending: int = int(os.environ.get("NAVI_FLUSH_MAX_PENDING", 20))
+
+
+class FlushMetrics:
+    def __init__(self):
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.flushes = 0
+        self.failures = 0
+        self.flushed_items = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+
+    def record(self, items, latency, ok):
+        self.flushes += 1
+        self.failures += 0 if ok else 1
+        self.flushed_items += items if ok else 0
+        self.last_latency = latency
+        self.total_latency += latency
+
+    def to_json(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'flushed_items': self.flushed_items,
+            'last_flush_seconds': round(self.last_latency, 3),
+            'mean_flush_seconds': round(self.total_latency / self.flushes, 3) if self.flushes else 0.0
+        }
+
+
+# Per-channel write-behind queue. Items are handed to flush(channel_id, items) on a background thread
+# at most once per window, or as soon as a channel has max_pending of them queued. Whatever is still
+# queued at interpreter exit is flushed before the process goes away. A paused channel's items are
+# held, however many pile up, until it is resumed
+class WriteBuffer:
+    def __init__(self, flush: Callable[[str, List], None], window=flush_window, max_pending=flush_max_pending):
+        self.flush_channel = flush
+        self.window = window
+        self.max_pending = max_pending
+        self.pending: Dict[str, List] = {}
+        self.queued_at: Dict[str, float] = {}
+        # channels whose items wait, however many there are, until resume
+        self.paused: Set[str] = set()
+        self.metrics = FlushMetrics()
+        self.condition = threading.Condition()
+        # only one flush runs at a time so a channel is never written from two threads at once
+        self.flush_lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="write-buffer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add(self, channel_id, items: List):
+        with self.condition:
+            self.pending.setdefault(channel_id, []).extend(items)
+            self.queued_at.setdefault(channel_id, time.monotonic())
+            self.metrics.queue_depth += len(items)
+            self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, self.metrics.queue_depth)
+            self.condition.notify()
+
+    # Drop whatever is queued for a channel, e.g. when its history is about to be rebuilt from scratch
+    def discard(self, channel_id):
+        with self.condition:
+            self.metrics.queue_depth -= len(self.pending.pop(channel_id, []))
+            self.queued_at.pop(channel_id, None)
+
+    def pause(self, channel_id):
+        with self.condition:
+            self.paused.add(channel_id)
+
+    def resume(self, channel_id):
+        with self.condition:
+            self.paused.discard(channel_id)
+            self.condition.notify()
+
+    def take(self, channel_ids) -> Dict[str, List]:
+        batch = {channel_id: self.pending.pop(channel_id) for channel_id in channel_ids if channel_id in self.pending}
+        for channel_id, items in batch.items():
+            self.queued_at.pop(channel_id, None)
+            self.metrics.queue_depth -= len(items)
+        return batch
+
+    def due(self, now) -> List[str]:
+        return [channel_id for channel_id, items in self.pending.items() if channel_id not in self.paused and
+                (len(items) >= self.max_pending or now - self.queued_at[channel_id] >= self.window)]
+
+    def next_deadline(self, now):
+        waiting = [queued_at for channel_id, queued_at in self.queued_at.items() if channel_id not in self.paused]
+        if not waiting:
+            return None
+        return max(0.0, min(waiting) + self.window - now)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.due(time.monotonic()):
+                    self.condition.wait(self.next_deadline(time.monotonic()))
+                if not self.running:
+                    return
+                batch = self.take(self.due(time.monotonic()))
+            self.write(batch)
+
+    def write(self, batch: Dict[str, List]):
+        with self.flush_lock:
+            for channel_id, items in batch.items():
+                started = time.monotonic()
+                ok = True
+                try:
+                    self.flush_channel(channel_id, items)
+                except Exception as e:
+                    ok = False
+                    print(f"Failed to flush {len(items)} items for channel {channel_id}: {e}")
+                self.metrics.record(len(items), time.monotonic() - started, ok)
+
+    # Flush now, either one channel or everything queued
+    def flush(self, channel_id=None):
+        with self.condition:
+            batch = self.take([channel_id] if channel_id else list(self.pending))
+        self.write(batch)
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
@@ -0,0 +1,206 @@
+# Drives channel history end to end against an in-memory Storage and a fake Slack client: a full
+# backfill, live links, a re-sync that crosses months and the migration of pre-sharding channels.
+# Run from the repo root: python -m pytest -q
+import calendar
+import itertools
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+for name in ("NAVI_METADATA_CACHE", "NAVI_URL_INDEX", "NAVI_LINK_INDEX"):
+    os.environ.setdefault(name, ":memory:")
+os.environ.setdefault("OAUTH_ACCESS_TOKEN", "test")
+os.environ.setdefault("GIST_ACCESS_TOKEN", "test")
+import pytest  # noqa: E402
+import history  # noqa: E402
+from canonical import UrlIndex  # noqa: E402
+from conversations import HistoryClient  # noqa: E402
+from history import Link  # noqa: E402
+from link_index import LinkIndex  # noqa: E402
+from metadata_cache import MetadataCache  # noqa: E402
+from storage import Storage  # noqa: E402
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.docs = {}
+        self.saves = []
+        self.ids = itertools.count(1)
+
+    def load(self, doc_id, names=None):
+        files = self.docs.get(doc_id, {})
+        return dict(files) if names is None else {name: files[name] for name in names if name in files}
+
+    def save(self, doc_id, files):
+        self.saves.append((doc_id, sorted(files)))
+        self.docs.setdefault(doc_id, {}).update(files)
+
+    def create(self, files, description):
+        doc_id = f"doc{next(self.ids)}"
+        self.docs[doc_id] = dict(files)
+        return doc_id
+
+    def url(self, doc_id):
+        return f"https://gist.example/{doc_id}"
+
+    def file_url(self, doc_id, name):
+        return f"{self.url(doc_id)}#{name}"
+
+
+# conversations.history over a list of messages: newest first, paged by cursor, after oldest
+class FakeSlack:
+    def __init__(self):
+        self.messages = []
+
+    def post(self, user, day, url):
+        self.messages.append({'user': user, 'ts': ts(day), 'text': f"<{url}>"})
+
+    def api_call(self, method, channel, limit, oldest=None, cursor=None, **_):
+        assert method == "conversations.history"
+        messages = sorted((message for message in self.messages if oldest is None or
+                           float(message['ts']) > float(oldest)), key=lambda x: -float(x['ts']))
+        start = int(cursor or 0)
+        page = messages[start:start + limit]
+        more = start + limit < len(messages)
+        return {'ok': True, 'messages': page, 'has_more': more,
+                'response_metadata': {'next_cursor': str(start + limit) if more else ""}}
+
+
+def ts(day):
+    return f"{calendar.timegm(datetime.strptime(day, '%Y-%m-%d').timetuple())}.000100"
+
+
+@pytest.fixture
+def slack(monkeypatch):
+    slack = FakeSlack()
+    storage = MemoryStorage()
+    storage.docs[history.gist_list_id] = {"keys.json": "{}"}
+    storage.docs[history.gist_find_all] = {"all.md": ""}
+    monkeypatch.setattr(history, "storage", storage)
+    monkeypatch.setattr(history, "history_client", HistoryClient(slack, page_size=2))
+    monkeypatch.setattr(history, "url_index", UrlIndex(":memory:"))
+    monkeypatch.setattr(history, "link_index", LinkIndex(":memory:"))
+    monkeypatch.setattr(history, "all_links_page", history.AllLinksPage())
+    monkeypatch.setattr(history, "channel_states", {})
+    monkeypatch.setattr(history, "get_users", lambda: {"U1": "Ann", "U2": "Bob"})
+    monkeypatch.setattr(history, "get_channel_name", lambda channel_id: "general")
+    monkeypatch.setattr(history.title_resolver, "fetch", lambda url: (url + " title", "ok"))
+    return slack
+
+
+def json_doc():
+    return history.storage.docs[history.read_keys()["C1"][0]]
+
+
+def md_doc():
+    return history.storage.docs[history.read_keys()["C1"][1]]
+
+
+def shard(key):
+    return {canonical: link for links in json.loads(json_doc()[f"general.{key}.json"]).values()
+            for link in links for canonical in [history.canonical_url(link['url'])]}
+
+
+def manifest():
+    return json.loads(json_doc()["general.json"])
+
+
+def test_rebuild_splits_history_by_month(slack):
+    slack.post("U1", "2024-01-05", "https://github.com/a")
+    slack.post("U2", "2024-01-20", "https://b.com/x")
+    slack.post("U2", "2024-02-03", "https://github.com/a?utm_source=tw")
+    history.get_history("C1")
+    # the February post is a repost, so nothing starts a February shard
+    assert manifest() == {'by': "month", 'shards': [{'key': "2024-01", 'links': 2}]}
+    assert shard("2024-01")["https://github.com/a"]['reposts'] == [ts("2024-02-03")]
+    assert "(posted 2 times)" in md_doc()["general.2024-01.md"]
+    assert "general.2024-01.md" in md_doc()["general.md"]
+
+
+def test_live_link_touches_only_the_newest_shard(slack):
+    slack.post("U1", "2024-01-05", "https://github.com/a")
+    slack.post("U1", "2024-02-05", "https://b.com/x")
+    history.get_history("C1")
+    history.storage.saves.clear()
+    history.write_links("C1", [Link("https://c.com/y", "U2", ts("2024-02-09"))])
+    written = {name for _, names in history.storage.saves for name in names}
+    assert written == {"general.log.json", "general.json", "general.md", "general.2024-02.md"}
+    assert "c.com/y" in md_doc()["general.2024-02.md"]
+    assert "c.com/y" not in md_doc()["general.2024-01.md"]
+
+
+def test_repost_of_an_older_shard_link_counts_there(slack):
+    slack.post("U1", "2024-01-05", "https://github.com/a")
+    slack.post("U1", "2024-02-05", "https://b.com/x")
+    history.get_history("C1")
+    history.write_links("C1", [Link("https://github.com/a/", "U2", ts("2024-02-09"))])
+    assert shard("2024-01")["https://github.com/a"]['reposts'] == [ts("2024-02-09")]
+    assert "github.com/a" not in md_doc()["general.2024-02.md"]
+    assert history.link_index.search("github")[0][6] == 2
+
+
+def test_resync_across_months_fills_each_month(slack):
+    slack.post("U1", "2024-01-05", "https://github.com/a")
+    history.get_history("C1")
+    slack.post("U1", "2024-02-20", "https://b.com/x")
+    slack.post("U2", "2024-02-21", "https://b.com/x")
+    slack.post("U2", "2024-03-02", "https://c.com/y")
+    history.get_history("C1")
+    assert [shard['key'] for shard in manifest()['shards']] == ["2024-01", "2024-02", "2024-03"]
+    assert shard("2024-02")["https://b.com/x"]['timestamp'] == ts("2024-02-20")
+    assert shard("2024-02")["https://b.com/x"]['reposts'] == [ts("2024-02-21")]
+    assert list(shard("2024-03")) == ["https://c.com/y"]
+
+
+def test_legacy_channel_is_migrated_once(slack):
+    github = Link("https://github.com/a", "U1", ts("2024-01-05")).to_json()
+    legacy = {'GitHub': [github],
+              'Misc': [github, Link("https://x.com/b", "U1", ts("2024-01-09"), reposts=[ts("2024-02-01")]).to_json(),
+                       Link("https://x.com/b?utm_source=q", "U2", ts("2024-01-07")).to_json()]}
+    history.storage.docs["j"] = {"general.json": json.dumps(legacy)}
+    history.storage.docs["m"] = {"general.md": "# general"}
+    history.write_keys({"C1": ["j", "m"]})
+    history.get_channel_state("C1")
+    assert manifest() == {'by': "month", 'shards': [{'key': "2024-01", 'links': 2}]}
+    assert shard("2024-01")["https://x.com/b"]['reposts'] == [ts("2024-01-09"), ts("2024-02-01")]
+    page = md_doc()["general.2024-01.md"]
+    assert page.count("github.com/a") == 2 and page.count("(posted 3 times)") == 1
+    history.storage.saves.clear()
+    history.channel_states.clear()
+    history.get_channel_state("C1")
+    assert history.storage.saves == []
+
+
+def test_restart_restores_indexes_without_refetching_titles(slack, monkeypatch):
+    slack.post("U1", "2024-01-05", "https://github.com/a")
+    slack.post("U1", "2024-02-05", "https://b.com/x")
+    history.get_history("C1")
+    # a new dyno: the local indexes and the title cache are gone
+    fetched = []
+    monkeypatch.setattr(history, "url_index", UrlIndex(":memory:"))
+    monkeypatch.setattr(history, "link_index", LinkIndex(":memory:"))
+    monkeypatch.setattr(history.title_resolver, "cache", MetadataCache(":memory:"))
+    monkeypatch.setattr(history.title_resolver, "fetch", lambda url: fetched.append(url) or (url + " title", "ok"))
+    history.channel_states.clear()
+    history.write_links("C1", [Link("https://c.com/y", "U2", ts("2024-03-01"))])
+    history.write_links("C1", [Link("https://b.com/x", "U2", ts("2024-03-02"))])
+    assert shard("2024-02")["https://b.com/x"]['reposts'] == [ts("2024-03-02")]
+    assert "b.com/x" not in md_doc()["general.2024-03.md"]
+    assert "https://github.com/a" not in fetched
+    assert history.link_index.search("github")[0][1] == "https://github.com/a"
+
+
+def test_link_first_shared_in_a_channel_slack_cannot_find(slack, monkeypatch):
+    history.url_index.record("C2", [Link("https://github.com/a", "U1", ts("2024-01-01"))])
+
+    def get_channel_name(channel_id):
+        if channel_id != "C1":
+            raise Exception("conversations.info failed: channel_not_found")
+        return "general"
+    monkeypatch.setattr(history, "get_channel_name", get_channel_name)
+    slack.post("U1", "2024-01-05", "https://github.com/a")
+    history.get_history("C1")
+    assert "github.com/a" in md_doc()["general.2024-01.md"]
+    assert "first shared" not in md_doc()["general.2024-01.md"]
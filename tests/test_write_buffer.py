@@ -0,0 +1,40 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from write_buffer import WriteBuffer  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self.flushed = threading.Event()
+
+    def __call__(self, channel_id, items):
+        self.calls.append((channel_id, list(items)))
+        self.flushed.set()
+
+
+def test_full_channel_is_flushed_straight_away():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, window=60, max_pending=3)
+    buffer.add("C1", [1, 2, 3])
+    assert recorder.flushed.wait(1)
+    assert recorder.calls == [("C1", [1, 2, 3])]
+
+
+def test_paused_channel_waits_however_full_until_resumed():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, window=0.01, max_pending=3)
+    buffer.pause("C1")
+    buffer.add("C1", list(range(25)))
+    buffer.add("C2", ["x"])
+    assert recorder.flushed.wait(1)
+    time.sleep(0.1)
+    assert recorder.calls == [("C2", ["x"])]
+    recorder.flushed.clear()
+    buffer.resume("C1")
+    assert recorder.flushed.wait(1)
+    assert recorder.calls[1:] == [("C1", list(range(25)))]